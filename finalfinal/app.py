@@ -1,43 +1,106 @@
 # app.py
-import sqlite3
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for
+from flask import Flask, jsonify, request, render_template, session, redirect, url_for, g, Response
 from flask_cors import CORS
 import os
-import joblib
-import pandas as pd
+import atexit
 from functools import wraps
 from datetime import datetime
 import uuid
 import random
+import hashlib
+from db_pool import ConnectionPool
+from db import migrate
+from status_stream import StatusWatcher
+from telemetry import TelemetryWriter, BufferFull, validate_readings, LOG_COLUMNS
+from status_cache import LatestStatusCache
+from safety import alert_masks, alert_counts, safety_report
+from rollups import query_series, DEFAULT_MAX_POINTS
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from feature_store import FeatureStore
+from reference_cache import ReferenceCache
+from cycle_writer import CycleWriter
+from dashboard_cache import DashboardCache, load_dashboard
+from prediction_metrics import StageHistograms, StageTimer, PredictionLogger, AccuracyMonitor
+from negotiation import NegotiatingJSONProvider, compress_response, matching_etag, negotiate
+from queries import LAST_CREATED_MACHINE_QUERY, LAST_TASK_MACHINE_QUERY, MONTH_TASKS_QUERY
 
 # --- CONFIGURATION ---
 DB_NAME = "operator_assistant.db"
 MODEL_PATH = "task_time_predictor.joblib"
+MAX_MONTH_WINDOW = 12
+MAX_PREDICT_BATCH = 10000
+# Shared key machines send in the X-API-Key header when pushing telemetry.
+# There is no default: with it unset, telemetry ingest is refused.
+INGEST_API_KEY = os.environ.get('INGEST_API_KEY')
+# SHARED_MODEL=1 memory-maps the compiled forest so all gunicorn workers share one copy.
+SHARED_MODEL = os.environ.get('SHARED_MODEL') == '1'
 
 app = Flask(__name__)
 app.secret_key = 'your_super_secret_key_for_production'
+# jsonify() honours Accept (JSON, compact JSON, MessagePack) and responses honour Accept-Encoding.
+app.json = NegotiatingJSONProvider(app)
+app.after_request(compress_response)
 CORS(app)
 
+db_pool = ConnectionPool(DB_NAME)
+
+status_watcher = StatusWatcher(db_pool)
+telemetry_writer = TelemetryWriter(db_pool)
+status_cache = LatestStatusCache(DB_NAME)
+feature_store = FeatureStore(DB_NAME)
+dashboard_cache = DashboardCache()
+reference_cache = ReferenceCache(DB_NAME)
+cycle_writer = CycleWriter(db_pool)
+
+def invalidate_flushed_dashboards(rows):
+    # Committed cycle counts make cached dashboards stale; pending ones are overlaid on reads.
+    for user_id in {row[0] for row in rows}:
+        dashboard_cache.invalidate(user_id)
+
+cycle_writer.on_flush.append(invalidate_flushed_dashboards)
+# Write any coalesced cycle counts before the process exits.
+atexit.register(cycle_writer.flush)
+telemetry_writer.on_commit.append(status_cache.apply)
+
+# Bring an existing database up to the current schema (adds any new indexes in place).
+if os.path.exists(DB_NAME):
+    with db_pool.connection() as conn:
+        migrate(conn)
+
 def get_db_connection():
-    """Establishes a connection to the database."""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def load_model():
-    """Loads the prediction model from disk."""
-    if os.path.exists(MODEL_PATH):
-        try:
-            return joblib.load(MODEL_PATH)
-        except Exception as e:
-            print(f"Error loading model: {e}")
-    return None
-
-model = load_model()
-if model:
-    print("Prediction model loaded successfully.")
-else:
-    print(f"Model file not found at {MODEL_PATH}. Prediction endpoint will not work. Run 'python ml_predictor.py' to train it.")
+    """Returns this request's pooled connection, checking one out on first use."""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+def month_day_range(month_str, months=1):
+    """Returns the half-open ('YYYY-MM-DD', 'YYYY-MM-DD') day range covering `months` months from month_str."""
+    start = datetime.strptime(month_str, '%Y-%m')
+    years, month_index = divmod(start.month - 1 + months, 12)
+    end = start.replace(year=start.year + years, month=month_index + 1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+prediction_cache = PredictionCache()
+model_registry = ModelRegistry(MODEL_PATH, db_pool, shared=SHARED_MODEL)
+# A new model version (or a rollback) empties the prediction cache.
+model_registry.on_swap.append(lambda m: prediction_cache.bind(m.compiled or m.pipeline, m.version))
+# Stage latencies (per worker), the prediction log, and rolling accuracy from it.
+prediction_timings = StageHistograms()
+prediction_logger = PredictionLogger(db_pool)
+accuracy_monitor = AccuracyMonitor(db_pool)
+
+@app.before_request
+def warm_model():
+    # The model loads in the background after the first request of any kind,
+    # so pages and non-ML APIs never wait on it.
+    model_registry.warm()
 
 def login_required(f):
     @wraps(f)
@@ -48,6 +111,29 @@ def login_required(f):
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
+
+def admin_required(f):
+    """login_required, plus the user's role must be 'admin' (read from the database, so a revoked role applies at once)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({"success": False, "message": "Authentication required"}), 401
+        user = get_db_connection().execute("SELECT role FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+        if user is None or user['role'] != 'admin':
+            return jsonify({"success": False, "message": "Admin role required"}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def api_key_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not INGEST_API_KEY:
+            # 403, not 503: clients retry a 503, and this needs an operator to set the key.
+            return jsonify({"success": False, "message": "Telemetry ingest is disabled: INGEST_API_KEY is not set"}), 403
+        if request.headers.get('X-API-Key') != INGEST_API_KEY:
+            return jsonify({"success": False, "message": "Invalid API key"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
     
 # --- AUTHENTICATION & PAGE SERVING ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -58,7 +144,6 @@ def login():
         password = data.get('password')
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE operator_id_str = ?', (operator_id_str,)).fetchone()
-        conn.close()
         if user and user['password'] == password:
             session['user_id'] = user['id']
             session['user_name'] = user['name']
@@ -92,42 +177,38 @@ def scheduler():
 @app.route('/api/dashboard_data')
 @login_required
 def get_dashboard_data():
-    conn = get_db_connection()
+    """
+    Today's tasks for the logged-in user and the machine they are on (from
+    today's tasks, else their most recent one), in a single query. Cached per
+    user for a few seconds; the task write endpoints below invalidate it.
+    """
+    user_id = session['user_id']
     today_str = datetime.today().strftime('%Y-%m-%d')
-    # This query correctly fetches tasks only for the logged-in user.
-    tasks_today = conn.execute("""
-        SELECT t.id, t.status, t.task_volume as target_cycles, t.current_cycles, pt.name as title, t.assigned_to_machine_id
-        FROM tasks t
-        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
-        WHERE t.assigned_to_user_id = ? AND t.day = ?
-        ORDER BY CASE t.status WHEN 'In Progress' THEN 1 WHEN 'Pending' THEN 2 ELSE 3 END, t.created_at
-    """, (session['user_id'], today_str)).fetchall()
-
-    machine = None
-    # Find the machine assigned to the user, either from today's tasks or their most recent task.
-    if tasks_today and tasks_today[0]['assigned_to_machine_id']:
-        machine_id = tasks_today[0]['assigned_to_machine_id']
-        machine = conn.execute("SELECT * FROM machines WHERE id = ?", (machine_id,)).fetchone()
-    else:
-        task_with_machine = conn.execute("SELECT assigned_to_machine_id FROM tasks WHERE assigned_to_user_id = ? ORDER BY day DESC LIMIT 1", (session['user_id'],)).fetchone()
-        if task_with_machine:
-            machine = conn.execute("SELECT * FROM machines WHERE id = ?", (task_with_machine['assigned_to_machine_id'],)).fetchone()
-
-    conn.close()
-    return jsonify({
-        "machine": dict(machine) if machine else None,
-        "tasks_today": [dict(task) for task in tasks_today]
-    })
+    # Taken before the read, so a count committed in between is still shown.
+    pending_cycles = cycle_writer.latest(user_id)
+    payload, generation = dashboard_cache.get(user_id, today_str)
+    if payload is None:
+        payload = load_dashboard(get_db_connection(), user_id, today_str)
+        dashboard_cache.put(user_id, today_str, payload, generation)
+    if pending_cycles:
+        payload = dict(payload, tasks_today=[
+            dict(task, current_cycles=pending_cycles[task['id']]) if task['id'] in pending_cycles else task
+            for task in payload['tasks_today']
+        ])
+    return jsonify(payload)
 
 @app.route('/api/task/update_cycles', methods=['POST'])
 @login_required
 def update_task_cycles():
-    data = request.json
-    conn = get_db_connection()
-    conn.execute("UPDATE tasks SET current_cycles = ? WHERE id = ? AND assigned_to_user_id = ?", 
-                 (data.get('current_cycles'), data.get('task_id'), session['user_id']))
-    conn.commit()
-    conn.close()
+    data = request.json or {}
+    task_id, cycles = data.get('task_id'), data.get('current_cycles')
+    # Checked here because the write happens later, in a batch with other operators' taps.
+    if not isinstance(task_id, str) or not task_id:
+        return jsonify({"success": False, "message": "task_id is required"}), 400
+    if isinstance(cycles, bool) or not isinstance(cycles, (int, float)) or not 0 <= cycles < float('inf'):
+        return jsonify({"success": False, "message": "current_cycles must be a non-negative number"}), 400
+    # Coalesced: only the newest count per task is written, in the next batch (see cycle_writer.py).
+    cycle_writer.update(session['user_id'], task_id, cycles)
     return jsonify({"success": True})
 
 @app.route('/api/task/update_status', methods=['POST'])
@@ -138,7 +219,7 @@ def update_task_status():
     conn.execute("UPDATE tasks SET status = ? WHERE id = ? AND assigned_to_user_id = ?", 
                  (data.get('status'), data.get('task_id'), session['user_id']))
     conn.commit()
-    conn.close()
+    dashboard_cache.invalidate(session['user_id'])
     return jsonify({"success": True})
 
 @app.route('/api/issue/report', methods=['POST'])
@@ -147,38 +228,152 @@ def report_issue():
     data = request.json
     conn = get_db_connection()
     # Find the machine associated with the user to log the issue correctly.
-    machine = conn.execute("SELECT assigned_to_machine_id as id FROM tasks WHERE assigned_to_user_id = ? ORDER BY created_at DESC LIMIT 1", (session['user_id'],)).fetchone()
+    machine = conn.execute(LAST_CREATED_MACHINE_QUERY, (session['user_id'],)).fetchone()
     machine_id = machine['id'] if machine else None
     
     conn.execute("INSERT INTO issue_reports (machine_id, user_id, category, details, timestamp) VALUES (?, ?, ?, ?, ?)",
                  (machine_id, session['user_id'], data['category'], data.get('details', ''), datetime.now().isoformat()))
     conn.commit()
-    conn.close()
     return jsonify({"success": True, "message": "Issue reported successfully."})
 
 @app.route('/api/status/<machine_id_str>')
 @login_required
 def get_machine_status(machine_id_str):
-    conn = get_db_connection()
-    log = conn.execute(
-        "SELECT * FROM machine_logs WHERE machine_id_str = ? ORDER BY timestamp DESC LIMIT 1",
-        (machine_id_str,)
-    ).fetchone()
-    conn.close()
+    # Served from the in-memory latest_status copy; machine_logs is never touched here.
+    log = status_cache.get(machine_id_str)
     if log:
-        return jsonify(dict(log))
+        return jsonify(log)
     return jsonify({"error": "No status found for this machine"}), 404
 
+@app.route('/api/fleet/status')
+@login_required
+def get_fleet_status():
+    """
+    Latest reading and safety alerts for every machine (or ?machines=EXC001,DOZ001)
+    in one response, built from the status cache. The ETag is derived from the
+    machines rows and the latest log ids, so an unchanged fleet answers 304
+    after one small query on machines and nothing else.
+    """
+    wanted = {m for m in request.args.get('machines', '').split(',') if m}
+    latest = {m: log for m, log in status_cache.all().items() if not wanted or m in wanted}
+    conn = get_db_connection()
+    machines = conn.execute("SELECT id, machine_id_str, model FROM machines ORDER BY machine_id_str").fetchall()
+    fingerprint = '|'.join([
+        ','.join(f"{m['id']}={m['machine_id_str']}={m['model']}" for m in machines),
+        ','.join(f"{m}={latest[m]['id']}" for m in sorted(latest)),
+        ','.join(sorted(wanted)),
+    ])
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+    matched = matching_etag(request.if_none_match, etag)
+    if matched:
+        return '', 304, {'ETag': f'"{matched}"'}
+
+    fleet = []
+    for machine in machines:
+        if wanted and machine['machine_id_str'] not in wanted:
+            continue
+        log = latest.get(machine['machine_id_str'])
+        fleet.append({
+            "machine_id_str": machine['machine_id_str'],
+            "model": machine['model'],
+            "status": log,
+            "safety_alerts": log['safety_alerts'] if log else [],
+            "safety_alert_type": log['safety_alert_type'] if log else 'None',
+        })
+    response = jsonify({"machines": fleet})
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/status/<machine_id_str>/stream')
+@login_required
+def stream_machine_status(machine_id_str):
+    """Server-Sent Events: a 'status' event per new machine_logs row, an 'alert' event when alerts change."""
+    return Response(
+        status_watcher.stream(machine_id_str),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/telemetry', methods=['POST'])
+@api_key_required
+def ingest_telemetry():
+    """
+    Batch ingestion of machine readings: {"readings": [{machine_id_str, seatbelt_status,
+    tilt_angle, visibility_percent, hydraulic_pressure, engine_temp, timestamp?}, ...]}.
+    The batch is validated as a whole and returns once it has been group-committed.
+    """
+    data = request.get_json(silent=True)
+    readings = data.get('readings') if isinstance(data, dict) else data
+    # The write happens on the telemetry writer's own connection, so don't hold one for the request.
+    with db_pool.connection() as conn:
+        machine_models = dict(conn.execute("SELECT machine_id_str, model FROM machines").fetchall())
+    rows, errors = validate_readings(readings, machine_models)
+    if errors:
+        return jsonify({"success": False, "error_count": len(errors), "errors": errors[:50]}), 400
+    try:
+        telemetry_writer.write(rows)
+    except BufferFull as e:
+        return jsonify({"success": False, "message": str(e)}), 503, {'Retry-After': '1'}
+    # Classify the whole batch in one vectorized pass so senders learn about alerts immediately.
+    batch = dict(zip(LOG_COLUMNS, zip(*rows)))
+    masks = alert_masks(batch, [machine_models.get(m) for m in batch['machine_id_str']])
+    return jsonify({"success": True, "accepted": len(rows), "alert_counts": alert_counts(masks)}), 201
+
+@app.route('/api/telemetry/<machine_id_str>/series')
+@login_required
+def get_telemetry_series(machine_id_str):
+    """
+    Chart data for one metric, e.g. ?metric=engine_temp&start=2025-07-01T06:00&end=2025-07-01T18:00&points=300.
+    Served from the rollup table at the finest resolution that fits the point budget.
+    """
+    start, end = request.args.get('start'), request.args.get('end')
+    if not start or not end:
+        return jsonify({"success": False, "message": "start and end are required"}), 400
+    try:
+        resolution, points = query_series(
+            get_db_connection(), machine_id_str, request.args.get('metric', 'engine_temp'), start, end,
+            request.args.get('points', default=DEFAULT_MAX_POINTS, type=int)
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid series request: {e}"}), 400
+    return jsonify({"machine_id_str": machine_id_str, "resolution": resolution, "points": points})
+
+@app.route('/api/reports/safety/<machine_id_str>')
+@login_required
+def get_safety_report(machine_id_str):
+    """Alert counts over a machine's history; ?start=/&end= bound the timestamp range."""
+    conn = get_db_connection()
+    return jsonify(safety_report(conn, machine_id_str, request.args.get('start'), request.args.get('end')))
+
+def json_response(rows):
+    """The response jsonify would send for a list of rows."""
+    return app.json.response([dict(row) for row in rows])
+
+def reference_response(entry):
+    """A cached reference-data response with its validators; 304 when the client's copy is current."""
+    headers = entry.headers
+    if request.if_none_match:
+        matched = matching_etag(request.if_none_match, entry.etag)
+        not_modified = matched is not None
+        if matched:
+            headers = dict(headers, ETag=f'"{matched}"')
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and entry.last_modified is not None and entry.last_modified <= since
+    if not_modified:
+        return '', 304, headers
+    return Response(entry.body, headers=headers)
+
 @app.route('/api/training/<path:machine_model>')
 @login_required
 def get_training_materials(machine_model):
-    conn = get_db_connection()
-    materials = conn.execute(
+    """Served from the reference cache, see reference_response."""
+    key = (machine_model, negotiate(request.accept_mimetypes))
+    entry = reference_cache.get('training_modules', key, lambda conn: json_response(conn.execute(
         "SELECT * FROM training_modules WHERE associated_machine_model = ? OR associated_machine_model = 'All'",
         (machine_model,)
-    ).fetchall()
-    conn.close()
-    return jsonify([dict(m) for m in materials])
+    )))
+    return reference_response(entry)
 
 # --- FIXED AND IMPROVED ENDPOINTS ---
 
@@ -188,55 +383,163 @@ def get_tasks_for_month():
     """
     FIXED: Fetches tasks for the logged-in user only.
     IMPROVED: Returns more task details for the calendar pop-up.
+    IMPROVED: Filters on a half-open day range so the (user, day) index is used,
+    and accepts ?months=N to return N consecutive months in one call.
     """
-    month_str = request.args.get('month') # e.g., '2025-07'
+    month_str = request.args.get('month', default=datetime.today().strftime('%Y-%m')) # e.g., '2025-07'
+    months = request.args.get('months', default=1, type=int)
+    try:
+        first_day, end_day = month_day_range(month_str, max(1, min(months, MAX_MONTH_WINDOW)))
+    except ValueError:
+        return jsonify({"success": False, "message": "month must be formatted as YYYY-MM"}), 400
     conn = get_db_connection()
-    tasks = conn.execute("""
-        SELECT t.id, t.day, t.status, t.task_volume, pt.name as title, pt.task_unit
-        FROM tasks t
-        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
-        WHERE strftime('%Y-%m', t.day) = ? AND t.assigned_to_user_id = ?
-    """, (month_str, session['user_id'])).fetchall()
-    conn.close()
+    tasks = conn.execute(MONTH_TASKS_QUERY, (session['user_id'], first_day, end_day)).fetchall()
     return jsonify([dict(task) for task in tasks])
     
 @app.route('/api/predefined_tasks')
 @login_required
 def get_predefined_tasks():
-    conn = get_db_connection()
-    tasks = conn.execute("SELECT * FROM predefined_tasks ORDER BY name").fetchall()
-    conn.close()
-    return jsonify([dict(task) for task in tasks])
+    """Served from the reference cache, see reference_response."""
+    entry = reference_cache.get('predefined_tasks', negotiate(request.accept_mimetypes), lambda conn: json_response(
+        conn.execute("SELECT * FROM predefined_tasks ORDER BY name")
+    ))
+    return reference_response(entry)
+
+def build_prediction_record(spec, context):
+    """Single-task equivalent of build_prediction_frame, without pandas."""
+    return dict(
+        spec,
+        safety_alerts_triggered=0,
+        idling_time_min=0,
+        day_of_week=datetime.strptime(spec['day'], '%Y-%m-%d').strftime('%w'),
+        hour_of_day=8,
+        **context
+    )
+
+def build_prediction_frame(specs, context):
+    """Turns task specs from the scheduler form into the model's feature frame."""
+    import pandas as pd
+
+    df = pd.DataFrame(specs)
+    # Add default/contextual values for features not in the simplified UI
+    df['safety_alerts_triggered'] = 0
+    df['idling_time_min'] = 0
+    df['day_of_week'] = pd.to_datetime(df['day'], format='%Y-%m-%d').dt.strftime('%w')
+    df['hour_of_day'] = 8 # Assume tasks start in the morning
+    for column, value in context.items():
+        df[column] = value
+    return df
 
 @app.route('/api/predict/time', methods=['POST'])
 @login_required
 def predict_time():
-    if not model:
+    current = model_registry.current
+    if not current:
         return jsonify({"success": False, "message": "Model not loaded"}), 503
     
     data = request.json
+    timer = StageTimer()
     try:
-        df = pd.DataFrame([data])
-        # Add default/contextual values for features not in the simplified UI
-        df['safety_alerts_triggered'] = 0
-        df['idling_time_min'] = 0
-        df['day_of_week'] = datetime.strptime(data['day'], '%Y-%m-%d').strftime('%w')
-        df['hour_of_day'] = 8 # Assume tasks start in the morning
-        
-        # Get operator and machine info from session/DB for accurate prediction
-        conn = get_db_connection()
-        user = conn.execute("SELECT experience_level, operator_id_str FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-        
-        # Use the user's last known machine for prediction context
-        last_task = conn.execute("SELECT m.machine_id_str FROM tasks t JOIN machines m ON t.assigned_to_machine_id = m.id WHERE t.assigned_to_user_id = ? ORDER BY t.day DESC LIMIT 1", (session['user_id'],)).fetchone()
-        conn.close()
-        
-        df['operator_experience_level'] = user['experience_level'] if user else 'Mid'
-        df['operator_id_str'] = user['operator_id_str'] if user else 'OP-UNKNOWN'
-        df['machine_id_str'] = last_task['machine_id_str'] if last_task else 'EXC-UNKNOWN'
-        
-        prediction = model.predict(df)
-        return jsonify({"success": True, "predicted_duration_minutes": round(prediction[0])})
+        # Operator, last machine and their history features, from the in-memory feature store
+        context = feature_store.context(session['user_id'])
+        timer.mark('context')
+        record = build_prediction_record(data, context)
+        timer.mark('features')
+        key = prediction_cache.key(record, current.version)
+        prediction = prediction_cache.get(key)
+        cached = prediction is not None
+        timer.mark('cache')
+        if not cached:
+            if current.compiled:
+                prediction = current.compiled.predict([record])[0]
+            else:
+                import pandas as pd
+                prediction = current.pipeline.predict(pd.DataFrame([record]))[0]
+            timer.mark('model')
+            prediction_cache.put(key, prediction)
+            timer.mark('cache')
+        prediction_id, = prediction_logger.record([(data.get('task_type'), prediction)], session['user_id'],
+                                                  current.version, cached, latency_ms=timer.total() * 1000)
+        timer.mark('log')
+        prediction_timings.observe('predict_time', timer)
+        return jsonify({"success": True, "predicted_duration_minutes": round(prediction), "prediction_id": prediction_id})
+    except Exception as e:
+        print(f"Prediction Error: {e}")
+        return jsonify({"success": False, "message": f"Prediction error: {e}"}), 400
+
+@app.route('/api/predict/cache')
+@login_required
+def predict_cache_stats():
+    """Hit-rate counters of this worker's prediction cache."""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/api/metrics')
+@login_required
+def metrics():
+    """
+    Prediction stage latencies (this worker), prediction log counters, and the
+    rolling accuracy per task type. ?format=prometheus returns the latency
+    histograms in the Prometheus text format instead.
+    """
+    if request.args.get('format') == 'prometheus':
+        return Response(prediction_timings.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify({
+        "latency": prediction_timings.snapshot(),
+        "prediction_log": prediction_logger.stats(),
+        "cache": prediction_cache.stats(),
+        "accuracy": accuracy_monitor.report(),
+        "accuracy_error": accuracy_monitor.last_error,
+    })
+
+@app.route('/api/model')
+@login_required
+def model_status():
+    """Live and previous model versions of this worker, and the last rejected reload."""
+    return jsonify(model_registry.status())
+
+@app.route('/api/model/rollback', methods=['POST'])
+@admin_required
+def model_rollback():
+    """Puts the previous model file back; every worker swaps to it (admins only)."""
+    if not model_registry.rollback():
+        return jsonify({"success": False, "message": model_registry.last_error}), 409
+    return jsonify({"success": True, **model_registry.status()})
+
+@app.route('/api/predict/time/batch', methods=['POST'])
+@login_required
+def predict_time_batch():
+    """
+    Forecasts many tasks at once: {"tasks": [{task_type, task_volume, weather_factor,
+    material_density_factor, day}, ...]}. One context lookup and one model.predict
+    call for the whole batch; predictions come back in request order.
+    """
+    current = model_registry.current
+    if not current:
+        return jsonify({"success": False, "message": "Model not loaded"}), 503
+
+    data = request.get_json(silent=True)
+    specs = data.get('tasks') if isinstance(data, dict) else data
+    if not isinstance(specs, list) or not 0 < len(specs) <= MAX_PREDICT_BATCH:
+        return jsonify({"success": False, "message": f"tasks must be a list of 1 to {MAX_PREDICT_BATCH} task specs"}), 400
+    timer = StageTimer()
+    try:
+        context = feature_store.context(session['user_id'])
+        timer.mark('context')
+        if current.pipeline is not None:
+            features = build_prediction_frame(specs, context)
+            timer.mark('features')
+            predictions = current.pipeline.predict(features)
+        else:
+            features = [build_prediction_record(spec, context) for spec in specs]
+            timer.mark('features')
+            predictions = current.compiled.predict(features)
+        timer.mark('model')
+        prediction_ids = prediction_logger.record([(spec.get('task_type'), p) for spec, p in zip(specs, predictions)],
+                                                  session['user_id'], current.version, source='batch')
+        timer.mark('log')
+        prediction_timings.observe('predict_time_batch', timer)
+        return jsonify({"success": True, "predicted_duration_minutes": [round(p) for p in predictions],
+                        "prediction_ids": prediction_ids})
     except Exception as e:
         print(f"Prediction Error: {e}")
         return jsonify({"success": False, "message": f"Prediction error: {e}"}), 400
@@ -247,39 +550,35 @@ def create_task():
     """
     FIXED: Assigns the new task to the currently logged-in user instead of a random one.
     IMPROVED: Assigns the user's most recently used machine, with a fallback to a random one.
+    IMPROVED: Keeps the prediction_id of the forecast the task was scheduled from, for accuracy tracking.
     """
     data = request.json
     conn = get_db_connection()
-    try:
-        # The new task is assigned to the user in the current session.
-        assigned_user_id = session['user_id']
-
-        # Find the user's most recently used machine to maintain consistency.
-        last_task = conn.execute(
-            "SELECT assigned_to_machine_id FROM tasks WHERE assigned_to_user_id = ? ORDER BY day DESC, created_at DESC LIMIT 1",
-            (assigned_user_id,)
-        ).fetchone()
-        
-        if last_task and last_task['assigned_to_machine_id']:
-            assigned_machine_id = last_task['assigned_to_machine_id']
-        else:
-            # Fallback to a random machine if the user has no task history.
-            machines = conn.execute("SELECT id FROM machines").fetchall()
-            if not machines:
-                return jsonify({"success": False, "message": "No machines available in the system."}), 500
-            assigned_machine_id = random.choice(machines)['id']
-
-        conn.execute("""
-            INSERT INTO tasks (id, predefined_task_id, assigned_to_user_id, assigned_to_machine_id, day, task_volume, weather_factor, material_density_factor, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'Pending', ?)
-        """, (
-            str(uuid.uuid4()), data['predefined_task_id'], assigned_user_id, assigned_machine_id,
-            data['day'], data['task_volume'], data['weather_factor'], data['material_density_factor'],
-            datetime.now().isoformat()
-        ))
-        conn.commit()
-    finally:
-        conn.close()
+    # The new task is assigned to the user in the current session.
+    assigned_user_id = session['user_id']
+
+    # Find the user's most recently used machine to maintain consistency.
+    last_task = conn.execute(LAST_TASK_MACHINE_QUERY, (assigned_user_id,)).fetchone()
+    
+    if last_task and last_task['assigned_to_machine_id']:
+        assigned_machine_id = last_task['assigned_to_machine_id']
+    else:
+        # Fallback to a random machine if the user has no task history.
+        machines = conn.execute("SELECT id FROM machines").fetchall()
+        if not machines:
+            return jsonify({"success": False, "message": "No machines available in the system."}), 500
+        assigned_machine_id = random.choice(machines)['id']
+
+    conn.execute("""
+        INSERT INTO tasks (id, predefined_task_id, assigned_to_user_id, assigned_to_machine_id, day, task_volume, weather_factor, material_density_factor, status, created_at, prediction_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'Pending', ?, ?)
+    """, (
+        str(uuid.uuid4()), data['predefined_task_id'], assigned_user_id, assigned_machine_id,
+        data['day'], data['task_volume'], data['weather_factor'], data['material_density_factor'],
+        datetime.now().isoformat(), data.get('prediction_id')
+    ))
+    conn.commit()
+    dashboard_cache.invalidate(assigned_user_id)
         
     return jsonify({"success": True, "message": "Task scheduled successfully."}), 201
 
@@ -287,4 +586,6 @@ def create_task():
 if __name__ == '__main__':
     if not os.path.exists(DB_NAME):
         print(f"Database not found. Please run 'python db.py' to create and seed it.")
+    if not INGEST_API_KEY:
+        print("INGEST_API_KEY is not set; /api/telemetry will refuse ingest until it is.")
     app.run(debug=True, port=5000)
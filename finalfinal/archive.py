@@ -0,0 +1,122 @@
+# archive.py
+"""
+Retention job for machine_logs: rows older than the horizon are moved into
+compressed Parquet files, one per machine per day, under ARCHIVE_DIR, keeping
+the live SQLite table small. read_logs() unions archive and live rows so
+historical queries don't need to know where a row lives.
+
+Run it from cron, e.g. nightly: `python archive.py --days 30`.
+"""
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import pandas as pd
+
+# --- CONFIGURATION ---
+DB_NAME = "operator_assistant.db"
+ARCHIVE_DIR = "log_archive"
+RETENTION_DAYS = 30
+COMPRESSION = "zstd"   # needs pyarrow; pandas.to_parquet picks the engine
+
+
+def machine_dir(machine_id_str):
+    """
+    A machine's archive directory. The id is percent-encoded (dots included), so
+    ids like '..' or 'a/b' stay a single directory inside ARCHIVE_DIR.
+    """
+    return os.path.join(ARCHIVE_DIR, quote(machine_id_str, safe='').replace('.', '%2E'))
+
+
+def archive_path(machine_id_str, day):
+    return os.path.join(machine_dir(machine_id_str), f"{day}.parquet")
+
+
+def write_archive(machine_id_str, day, df):
+    """Writes (or merges into) one machine-day archive file, atomically."""
+    path = archive_path(machine_id_str, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        # Late rows for an already archived day: merge, keeping one copy of each row.
+        df = pd.concat([pd.read_parquet(path), df]).drop_duplicates(subset='id')
+    df = df.sort_values('timestamp')
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+
+
+def archive_old_logs(conn, retention_days=RETENTION_DAYS):
+    """
+    Moves machine_logs rows from before the retention horizon into the archive.
+    Each machine-day is written to disk before its rows are deleted, so a crash
+    can leave a row in both places (read_logs de-duplicates) but never lose it.
+    The write lock is held only for the delete, and only the rows written to the
+    file are deleted; late rows for that day wait for the next run. Returns the
+    number of rows moved.
+    """
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    groups = conn.execute("""
+        SELECT machine_id_str, substr(timestamp, 1, 10) AS day
+        FROM machine_logs
+        WHERE timestamp < ?
+        GROUP BY machine_id_str, day
+    """, (cutoff,)).fetchall()
+
+    moved = 0
+    for machine_id_str, day in groups:
+        next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        day_range = (machine_id_str, day, next_day)
+        df = pd.read_sql_query(
+            "SELECT * FROM machine_logs WHERE machine_id_str = ? AND timestamp >= ? AND timestamp < ?",
+            conn, params=day_range
+        )
+        # The file is written without holding the write lock, so ingest isn't blocked meanwhile.
+        write_archive(machine_id_str, day, df)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM machine_logs WHERE id = ?", ((row_id,) for row_id in df['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved += len(df)
+    return moved
+
+
+def read_logs(conn, machine_id_str, start=None, end=None):
+    """All of a machine's readings with start <= timestamp < end, from archive files and machine_logs."""
+    frames = []
+    directory = machine_dir(machine_id_str)
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.parquet'):
+                continue
+            day = name[:-len('.parquet')]
+            if (start and day < start[:10]) or (end and day > end[:10]):
+                continue
+            frames.append(pd.read_parquet(os.path.join(directory, name)))
+    frames.append(pd.read_sql_query(
+        "SELECT * FROM machine_logs WHERE machine_id_str = ? AND timestamp >= ? AND timestamp < ?",
+        conn, params=(machine_id_str, start or '', end or '9999')
+    ))
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset='id')
+    if start:
+        df = df[df['timestamp'] >= start]
+    if end:
+        df = df[df['timestamp'] < end]
+    return df.sort_values('timestamp', ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive old machine_logs rows to Parquet.")
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help="keep this many days in SQLite")
+    args = parser.parse_args()
+    if not os.path.exists(DB_NAME):
+        print(f"Database '{DB_NAME}' not found. Please run 'db.py' first to create and seed it.")
+    else:
+        conn = sqlite3.connect(DB_NAME, timeout=30)
+        moved = archive_old_logs(conn, args.days)
+        conn.close()
+        print(f"Archived {moved} machine log rows older than {args.days} days to '{ARCHIVE_DIR}'.")
@@ -0,0 +1,217 @@
+# asgi.py
+"""
+ASGI deployment mode for the operator assistant API:
+
+    uvicorn asgi:app --workers 4        (or any ASGI server: hypercorn, daphne, ...)
+
+The Flask views are unchanged; this module decides where they run.
+- Regular requests are handed to the Flask app on a bounded thread pool
+  (ASGI_THREADS, by default one thread per pooled SQLite connection). Every
+  DB call happens on those threads and never on the event loop. Requests
+  beyond the pool size wait as coroutines, not as threads.
+- /api/status/<machine>/stream (Server-Sent Events) is served on the event
+  loop itself. StatusWatcher's thread publishes into a per-client queue the
+  loop awaits, so an open stream costs a coroutine and a socket, not a
+  thread.
+- The lifespan shutdown writes any coalesced cycle counts.
+
+`python app.py` keeps the synchronous development server.
+`python benchmark.py asgi` compares how the two behave with many streams open.
+"""
+import asyncio
+import io
+import os
+import queue
+import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import session
+
+import app as flask_app
+from db_pool import POOL_SIZE
+from status_stream import HEARTBEAT_SEC, SUBSCRIBER_QUEUE_SIZE
+
+# --- CONFIGURATION ---
+MAX_THREADS = int(os.environ.get('ASGI_THREADS', POOL_SIZE))
+
+STREAM_PATH = re.compile(r'^/api/status/([^/]+)/stream$')
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+class LoopQueue:
+    """
+    A subscriber queue for StatusWatcher: publish() runs on the watcher thread
+    and calls the queue.Queue methods below; a coroutine on the event loop
+    awaits get(). close() wakes the reader when its client disconnects.
+    """
+
+    def __init__(self, loop, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self._loop = loop
+        self._maxsize = maxsize
+        self._items = deque()
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def full(self):
+        return len(self._items) >= self._maxsize
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def put_nowait(self, item):
+        self._items.append(item)
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self, timeout):
+        """Next message, None once closed; raises asyncio.TimeoutError after timeout seconds without one."""
+        while True:
+            if self._items:
+                return self._items.popleft()
+            if self.closed:
+                return None
+            self._ready.clear()
+            # A publish between the check above and clear() would be missed without this.
+            if self._items or self.closed:
+                continue
+            await asyncio.wait_for(self._ready.wait(), timeout)
+
+
+def build_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP scope (PEP 3333 strings are latin-1)."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """Runs one request through the Flask app (on a pool thread); returns (status, headers, body)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'], response['headers'] = int(status.split(' ', 1)[0]), headers
+
+    result = flask_app.app.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+class AsgiApp:
+    def __init__(self, max_threads=MAX_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(self.executor, flask_app.cycle_writer.flush)
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        environ = build_environ(scope, body)
+        stream = STREAM_PATH.match(scope['path'])
+        if stream and scope['method'] == 'GET':
+            await self.status_stream(stream.group(1), environ, receive, send)
+            return
+        status, headers, body = await asyncio.get_running_loop().run_in_executor(self.executor, call_wsgi, environ)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def status_stream(self, machine_id_str, environ, receive, send):
+        """The SSE endpoint of app.stream_machine_status, on the event loop."""
+        with flask_app.app.request_context(environ):
+            logged_in = 'user_id' in session
+        if not logged_in:
+            await send({'type': 'http.response.start', 'status': 401, 'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': b'{"message":"Authentication required","success":false}\n'})
+            return
+
+        q = LoopQueue(asyncio.get_running_loop())
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            q.close()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        flask_app.status_watcher.subscribe(machine_id_str, q)
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+            while True:
+                try:
+                    message = await q.get(HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    message = ": heartbeat\n\n"
+                if message is None:
+                    break
+                await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+        finally:
+            flask_app.status_watcher.unsubscribe(machine_id_str, q)
+            watcher.cancel()
+
+
+app = AsgiApp()
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("ASGI mode needs an ASGI server: pip install uvicorn, then run 'uvicorn asgi:app'.")
+    uvicorn.run("asgi:app", port=5000)
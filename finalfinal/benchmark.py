@@ -0,0 +1,1014 @@
+# benchmark.py
+"""
+Micro-benchmarks for the operator assistant backend.
+
+Every benchmark runs against a throwaway copy of operator_assistant.db, so the
+real database is never modified. Run e.g. `python benchmark.py pool`.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+DB_NAME = "operator_assistant.db"
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(f):
+        BENCHMARKS[name] = f
+        return f
+    return register
+
+
+def scratch_db():
+    """Copies the seeded database into a temp dir and returns the copy's path."""
+    if not os.path.exists(DB_NAME):
+        raise SystemExit(f"Database '{DB_NAME}' not found. Run 'python db.py' first.")
+    path = os.path.join(tempfile.mkdtemp(prefix="oa-bench-"), DB_NAME)
+    shutil.copy(DB_NAME, path)
+    return path
+
+
+def logged_in_client(flask_app, operator_id_str='OP1001'):
+    client = flask_app.test_client()
+    client.post('/login', json={'operator_id_str': operator_id_str, 'password': 'pass'})
+    return client
+
+
+def run_concurrently(workers, seconds):
+    """Runs each worker callable in its own thread for `seconds`; returns total calls made."""
+    counts = [0] * len(workers)
+    deadline = time.perf_counter() + seconds
+
+    def loop(i, work):
+        while time.perf_counter() < deadline:
+            work()
+            counts[i] += 1
+
+    threads = [threading.Thread(target=loop, args=(i, w)) for i, w in enumerate(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts)
+
+
+class ConnectPerRequest:
+    """The old behaviour: a brand-new sqlite3 connection for every request."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+
+    def acquire(self):
+        conn = sqlite3.connect(self.db_name)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release(self, conn):
+        conn.close()
+
+
+def legacy_update_cycles():
+    """/api/task/update_cycles before write coalescing: an UPDATE and a commit per tap."""
+    from flask import jsonify, request, session
+    import app as app_module
+
+    data = request.json
+    conn = app_module.get_db_connection()
+    conn.execute("UPDATE tasks SET current_cycles = ? WHERE id = ? AND assigned_to_user_id = ?",
+                 (data.get('current_cycles'), data.get('task_id'), session['user_id']))
+    conn.commit()
+    app_module.dashboard_cache.invalidate(session['user_id'])
+    return jsonify({"success": True})
+
+
+@benchmark("pool")
+def bench_pool(args):
+    """Requests/sec for status + dashboard readers and cycle-update writers, per-request connect vs pool."""
+    import app as app_module
+    from db_pool import ConnectionPool
+
+    # Writers commit on the request's connection, as before write coalescing.
+    app_module.app.view_functions['update_task_cycles'] = app_module.login_required(legacy_update_cycles)
+    db_path = scratch_db()
+    task_id = sqlite3.connect(db_path).execute(
+        "SELECT t.id FROM tasks t JOIN users u ON t.assigned_to_user_id = u.id WHERE u.operator_id_str = 'OP1001' LIMIT 1"
+    ).fetchone()[0]
+
+    def make_workers():
+        workers = []
+        for i in range(args.readers):
+            client = logged_in_client(app_module.app)
+            path = '/api/status/EXC001' if i % 2 else '/api/dashboard_data'
+            workers.append(lambda c=client, p=path: c.get(p))
+        for i in range(args.writers):
+            client = logged_in_client(app_module.app)
+            workers.append(lambda c=client, n=i: c.post('/api/task/update_cycles', json={'task_id': task_id, 'current_cycles': n}))
+        return workers
+
+    for label, pool in (("connect-per-request", ConnectPerRequest(db_path)), ("pooled WAL", ConnectionPool(db_path))):
+        app_module.db_pool = pool
+        total = run_concurrently(make_workers(), args.seconds)
+        print(f"{label:>22}: {total / args.seconds:8.1f} req/s "
+              f"({args.readers} readers, {args.writers} writers, {args.seconds}s)")
+        if hasattr(pool, 'close_all'):
+            pool.close_all()
+
+
+def fill_tasks(conn, rows, users=50, days=5 * 365):
+    """Bulk-loads `rows` synthetic tasks spread over `users` operators and `days` days."""
+    import random
+    import uuid
+    from datetime import date, timedelta
+
+    predefined_ids = [r[0] for r in conn.execute("SELECT id FROM predefined_tasks")]
+    machine_ids = [r[0] for r in conn.execute("SELECT id FROM machines")]
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    conn.executemany(
+        "INSERT INTO users (id, operator_id_str, name, experience_level, password) VALUES (?, ?, ?, 'Mid', 'pass')",
+        [(uid, f"BENCH{i:04d}", f"Bench Operator {i}") for i, uid in enumerate(user_ids)],
+    )
+    first_day = date.today() - timedelta(days=days)
+    conn.executemany(
+        "INSERT INTO tasks (id, predefined_task_id, status, day, task_volume, assigned_to_user_id, assigned_to_machine_id, created_at) "
+        "VALUES (?, ?, 'Completed', ?, 100, ?, ?, ?)",
+        ((str(uuid.uuid4()), random.choice(predefined_ids), (first_day + timedelta(days=random.randrange(days))).isoformat(),
+          random.choice(user_ids), random.choice(machine_ids), first_day.isoformat()) for _ in range(rows)),
+    )
+    conn.commit()
+    return user_ids
+
+
+def time_query(conn, sql, params, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000, len(rows)
+
+
+@benchmark("month")
+def bench_month(args):
+    """Calendar query latency over a large tasks table: strftime() filter vs half-open day range."""
+    from app import month_day_range
+    from db import migrate
+    from db_pool import open_connection
+
+    conn = open_connection(scratch_db())
+    migrate(conn)
+    print(f"Loading {args.rows:,} tasks...")
+    user_id = fill_tasks(conn, args.rows)[0]
+    conn.execute("ANALYZE")
+    month = time.strftime('%Y-%m', time.localtime(time.time() - 180 * 86400))
+    select = """
+        SELECT t.id, t.day, t.status, t.task_volume, pt.name as title, pt.task_unit
+        FROM tasks t
+        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
+    """
+    cases = [
+        ("strftime('%Y-%m', day) = ?", select + "WHERE strftime('%Y-%m', t.day) = ? AND t.assigned_to_user_id = ?", (month, user_id)),
+        ("day range, 1 month", select + "WHERE t.assigned_to_user_id = ? AND t.day >= ? AND t.day < ? ORDER BY t.day", (user_id, *month_day_range(month))),
+        ("day range, 3 months", select + "WHERE t.assigned_to_user_id = ? AND t.day >= ? AND t.day < ? ORDER BY t.day", (user_id, *month_day_range(month, 3))),
+        ("strftime, no user filter", select + "WHERE strftime('%Y-%m', t.day) = ?", (month,)),
+    ]
+    for label, sql, params in cases:
+        ms, count = time_query(conn, sql, params, args.repeat)
+        print(f"{label:>26}: {ms:8.2f} ms/query ({count} rows)")
+    conn.close()
+
+
+def synthetic_readings(n, machines=('EXC001', 'EXC002', 'DOZ001')):
+    import random
+    from datetime import datetime, timedelta
+
+    start = datetime.now()
+    return [{
+        "machine_id_str": random.choice(machines),
+        "timestamp": (start + timedelta(milliseconds=i)).isoformat(),
+        "seatbelt_status": random.choice(('Fastened', 'Fastened', 'Unfastened')),
+        "tilt_angle": round(random.uniform(0, 20), 1),
+        "visibility_percent": random.randint(30, 100),
+        "hydraulic_pressure": round(random.uniform(2700, 3200)),
+        "engine_temp": round(random.uniform(85, 115)),
+    } for i in range(n)]
+
+
+@benchmark("ingest")
+def bench_ingest(args):
+    """Telemetry rows/sec through /api/telemetry with concurrent senders and group commit."""
+    import app as app_module
+    from db_pool import ConnectionPool
+    from telemetry import TelemetryWriter
+
+    pool = ConnectionPool(scratch_db())
+    app_module.db_pool = pool
+    app_module.telemetry_writer = TelemetryWriter(pool)
+    app_module.INGEST_API_KEY = app_module.INGEST_API_KEY or 'bench-ingest-key'
+    headers = {'X-API-Key': app_module.INGEST_API_KEY}
+    batch = synthetic_readings(args.batch)
+
+    def sender():
+        client = app_module.app.test_client()
+        return lambda: client.post('/api/telemetry', json={"readings": batch}, headers=headers)
+
+    senders = max(1, args.writers)
+    calls = run_concurrently([sender() for _ in range(senders)], args.seconds)
+    print(f"{calls * args.batch / args.seconds:10.0f} rows/s "
+          f"({senders} senders, {args.batch} rows per request, {args.seconds}s)")
+    with pool.connection() as conn:
+        print(f"machine_logs now holds {conn.execute('SELECT COUNT(*) FROM machine_logs').fetchone()[0]:,} rows")
+
+
+@benchmark("classify")
+def bench_classify(args):
+    """Safety classification throughput: vectorized alert_masks vs the per-row rules."""
+    import numpy as np
+    import pandas as pd
+    from safety import active_alerts, alert_masks, alert_names
+
+    rng = np.random.default_rng(42)
+    n = args.rows
+    df = pd.DataFrame({
+        'seatbelt_status': rng.choice(np.array(['Fastened', 'Unfastened'], dtype=object), n, p=[0.9, 0.1]),
+        'tilt_angle': rng.uniform(0, 20, n),
+        'visibility_percent': rng.integers(30, 101, n),
+        'hydraulic_pressure': rng.uniform(2700, 3200, n),
+        'engine_temp': rng.uniform(85, 115, n),
+        'model': rng.choice(np.array(['Caterpillar 336 Excavator', 'Komatsu PC210 LC', 'Caterpillar D6R Dozer'], dtype=object), n),
+    })
+
+    start = time.perf_counter()
+    masks = alert_masks(df, df['model'])
+    vectorized = time.perf_counter() - start
+    print(f"{'vectorized':>12}: {n / vectorized:14,.0f} rows/s ({vectorized:.3f}s for {n:,} rows)")
+
+    sample = df.head(min(n, 100_000)).to_dict('records')
+    start = time.perf_counter()
+    per_row = [active_alerts(r, r['model']) for r in sample]
+    looped = time.perf_counter() - start
+    print(f"{'per-row':>12}: {len(sample) / looped:14,.0f} rows/s (measured on {len(sample):,} rows)")
+    assert per_row == [alert_names(m) for m in masks[:len(sample)]], "vectorized and per-row results differ"
+
+
+def synthetic_task_specs(n):
+    import random
+    from datetime import date, timedelta
+
+    names = ['Trenching for Utilities', 'Loading Haul Trucks', 'Site Grading']
+    return [{
+        "task_type": random.choice(names),
+        "task_volume": round(random.uniform(50, 5000), 1),
+        "weather_factor": random.choice([1.0, 1.1, 1.2, 1.3]),
+        "material_density_factor": round(random.uniform(0.8, 1.5), 2),
+        "day": (date.today() + timedelta(days=random.randrange(60))).isoformat(),
+    } for _ in range(n)]
+
+
+@benchmark("predict")
+def bench_predict(args):
+    """Duration forecasts/sec: /api/predict/time per task vs /api/predict/time/batch."""
+    import app as app_module
+
+    app_module.db_pool = __import__('db_pool').ConnectionPool(scratch_db())
+    client = logged_in_client(app_module.app)
+    if not app_module.model_registry.current:
+        raise SystemExit("Model not loaded; run 'python ml_predictor.py' first.")
+
+    specs = synthetic_task_specs(100)
+    start = time.perf_counter()
+    for spec in specs:
+        client.post('/api/predict/time', json=spec)
+    single = time.perf_counter() - start
+    print(f"{'single x 100':>14}: {single * 1000:9.1f} ms total, {len(specs) / single:9.0f} predictions/s")
+
+    for n in (1, 100, 10000):
+        specs = synthetic_task_specs(n)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.post('/api/predict/time/batch', json={"tasks": specs})
+        elapsed = (time.perf_counter() - start) / args.repeat
+        assert len(response.json['predicted_duration_minutes']) == n
+        print(f"{f'batch of {n}':>14}: {elapsed * 1000:9.1f} ms/call,  {n / elapsed:9.0f} predictions/s")
+
+
+@benchmark("inference")
+def bench_inference(args):
+    """Single-row latency: pipeline.predict on a DataFrame vs the compiled NumPy path."""
+    import numpy as np
+    import app as app_module
+
+    current = app_module.model_registry.current
+    if not current:
+        raise SystemExit("Model not loaded; run 'python ml_predictor.py' first.")
+    if not current.compiled:
+        raise SystemExit("Model could not be compiled.")
+    user_id = sqlite3.connect(app_module.DB_NAME).execute(
+        "SELECT id FROM users WHERE operator_id_str = 'OP1001'"
+    ).fetchone()[0]
+    # The app's context, store features included, so the model gets every column it was trained on.
+    context = app_module.feature_store.context(user_id)
+    records = [app_module.build_prediction_record(spec, context) for spec in synthetic_task_specs(args.repeat * 10)]
+
+    for label, predict in (
+        ("model.predict", lambda r: current.pipeline.predict(app_module.build_prediction_frame([r], context))[0]),
+        ("compiled", lambda r: current.compiled.predict([r])[0]),
+    ):
+        latencies = []
+        for record in records:
+            start = time.perf_counter()
+            predict(record)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{label:>14}: p50 {p50:7.3f} ms, p99 {p99:7.3f} ms")
+
+    expected = current.pipeline.predict(app_module.build_prediction_frame(records, context))
+    assert np.allclose(current.compiled.predict(records), expected, rtol=1e-12, atol=0), "compiled predictions differ"
+
+
+def clone_completed_tasks(conn, n, completed_at):
+    """Adds n training rows copied from random completed tasks, with new ids and the given completed_at."""
+    while n > 0:
+        n -= conn.execute("""
+            INSERT INTO tasks (id, predefined_task_id, status, day, task_volume, current_cycles, assigned_to_user_id,
+                assigned_to_machine_id, created_at, started_at, completed_at, actual_duration_minutes, weather_factor,
+                material_density_factor, safety_alerts_triggered, idling_time_min)
+            SELECT lower(hex(randomblob(16))), predefined_task_id, status, day, task_volume, current_cycles,
+                assigned_to_user_id, assigned_to_machine_id, created_at, started_at, ?,
+                actual_duration_minutes * (0.9 + abs(random() % 200) / 1000.0), weather_factor,
+                material_density_factor, safety_alerts_triggered, idling_time_min
+            FROM tasks WHERE status = 'Completed' AND actual_duration_minutes IS NOT NULL
+            ORDER BY random() LIMIT ?
+        """, (completed_at, n)).rowcount
+    conn.commit()
+
+
+@benchmark("retrain")
+def bench_retrain(args):
+    """Retraining cost as history grows: full train_model vs train_incremental (use e.g. --rows 50000)."""
+    import contextlib
+    import io
+    import ml_predictor
+
+    db = scratch_db()
+    workdir = os.path.dirname(db)
+    full_model, incremental_model = os.path.join(workdir, "full.joblib"), os.path.join(workdir, "incremental.joblib")
+    cache_dir = os.path.join(workdir, "training_cache")
+    conn = sqlite3.connect(db)
+    clone_completed_tasks(conn, args.rows, '2090-01-01T00:00:00')
+
+    def timed(label, train, *train_args):
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            train(*train_args)
+        print(f"{label:>34}: {time.perf_counter() - start:7.2f} s  ({output.getvalue().strip().splitlines()[-1]})")
+
+    timed("incremental bootstrap (full fit)", ml_predictor.train_incremental, db, incremental_model, cache_dir)
+    new_rows = max(ml_predictor.MIN_NEW_ROWS, args.rows // 100)
+    for step in range(3):
+        clone_completed_tasks(conn, new_rows, f'2091-01-0{step + 1}T00:00:00')
+        total = conn.execute("SELECT COUNT(*) FROM tasks WHERE actual_duration_minutes IS NOT NULL").fetchone()[0]
+        print(f"+{new_rows} completed tasks ({total} total)")
+        timed("train_model (full)", ml_predictor.train_model, db, full_model)
+        timed("train_incremental", ml_predictor.train_incremental, db, incremental_model, cache_dir)
+    conn.close()
+
+def memory_usage():
+    """Rss, Pss and private memory of this process in MB (Linux), from /proc/self/smaps_rollup."""
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                usage[key] = int(rest.split()[0]) / 1024
+    return {'rss': usage['Rss'], 'pss': usage['Pss'], 'private': usage['Private_Clean'] + usage['Private_Dirty']}
+
+
+def memory_worker(shared, results, done):
+    """One stand-in gunicorn worker: loads the model and reports what that cost in memory."""
+    import numpy as np
+    from model_registry import ModelRegistry
+
+    before = memory_usage()
+    loaded = ModelRegistry(os.path.abspath("task_time_predictor.joblib"), None, shared=shared).load()
+    # A long-running worker ends up touching every node; fault them all in now.
+    for array in (loaded.compiled.left, loaded.compiled.right, loaded.compiled.feature,
+                  loaded.compiled.threshold, loaded.compiled.value):
+        np.asarray(array).sum()
+    after = memory_usage()
+    results.put({key: after[key] - before[key] for key in after})
+    done.wait()   # stay alive until every worker has measured, so shared pages are counted once
+
+
+@benchmark("memory")
+def bench_memory(args):
+    """Model memory per worker process: private joblib.load vs the shared memory-mapped forest."""
+    import multiprocessing
+
+    if not os.path.exists("task_time_predictor.joblib"):
+        raise SystemExit("Model not found; run 'python ml_predictor.py' first.")
+    ctx = multiprocessing.get_context('spawn')   # fresh interpreters, like workers without --preload
+    for label, shared in (("private", False), ("shared mmap", True)):
+        results, done = ctx.Queue(), ctx.Event()
+        workers = [ctx.Process(target=memory_worker, args=(shared, results, done)) for _ in range(args.workers)]
+        for w in workers:
+            w.start()
+        deltas = [results.get() for _ in workers]
+        done.set()
+        for w in workers:
+            w.join()
+        mean = {key: sum(d[key] for d in deltas) / len(deltas) for key in deltas[0]}
+        print(f"{label:>12} x {args.workers}: +{mean['rss']:6.1f} MB RSS, +{mean['pss']:6.1f} MB PSS, "
+              f"+{mean['private']:6.1f} MB private per worker")
+
+def startup_probe():
+    """Run in a fresh interpreter: seconds from `import app` to the first /login page and first prediction."""
+    import json
+    import sys
+
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+    app_module.db_pool = __import__('db_pool').ConnectionPool(scratch_db())
+    client = app_module.app.test_client()
+    client.get('/login')
+    login_page = time.perf_counter()
+    client.post('/login', json={'operator_id_str': 'OP1001', 'password': 'pass'})
+    spec = {"task_type": "Site Grading", "task_volume": 500, "weather_factor": 1.0,
+            "material_density_factor": 1.0, "day": time.strftime('%Y-%m-%d')}
+    client.post('/api/predict/time', json=spec)
+    prediction = time.perf_counter()
+    json.dump({'import': imported - start, 'login': login_page - start, 'prediction': prediction - start}, sys.stdout)
+
+
+@benchmark("startup")
+def bench_startup(args):
+    """Cold-start cost: `python -X importtime -c 'import app'`, then time to first /login and first prediction."""
+    import json
+    import re
+    import subprocess
+    import sys
+
+    trace = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                           capture_output=True, text=True).stderr
+    # Lines look like "import time:  self [us] | cumulative | <indent>module"; app's direct imports are indented once.
+    entries = [(int(cumulative), name) for cumulative, name in
+               re.findall(r'import time:\s+\d+ \|\s+(\d+) \| ( *\S+)$', trace, re.M)]
+    total = next(us for us, name in entries if name == 'app')
+    print(f"import app: {total / 1e6:.3f} s; heaviest direct imports:")
+    for us, name in sorted((e for e in entries if re.match(r'^  \S', e[1])), reverse=True)[:8]:
+        print(f"  {name.strip():<20} {us / 1e6:7.3f} s")
+
+    for _ in range(3):
+        probe = subprocess.run([sys.executable, '-c', 'import benchmark; benchmark.startup_probe()'],
+                               capture_output=True, text=True)
+        timings = json.loads(probe.stdout.strip().splitlines()[-1])
+        print(f"import {timings['import']:.3f} s, first /login {timings['login']:.3f} s, "
+              f"first prediction {timings['prediction']:.3f} s")
+
+def legacy_dashboard_data():
+    """/api/dashboard_data before the single query and cache: up to three sequential queries."""
+    from datetime import datetime
+    from flask import jsonify, session
+    import app as app_module
+
+    conn = app_module.get_db_connection()
+    today_str = datetime.today().strftime('%Y-%m-%d')
+    tasks_today = conn.execute("""
+        SELECT t.id, t.status, t.task_volume as target_cycles, t.current_cycles, pt.name as title, t.assigned_to_machine_id
+        FROM tasks t
+        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
+        WHERE t.assigned_to_user_id = ? AND t.day = ?
+        ORDER BY CASE t.status WHEN 'In Progress' THEN 1 WHEN 'Pending' THEN 2 ELSE 3 END, t.created_at
+    """, (session['user_id'], today_str)).fetchall()
+    machine = None
+    if tasks_today and tasks_today[0]['assigned_to_machine_id']:
+        machine = conn.execute("SELECT * FROM machines WHERE id = ?", (tasks_today[0]['assigned_to_machine_id'],)).fetchone()
+    else:
+        last = conn.execute("SELECT assigned_to_machine_id FROM tasks WHERE assigned_to_user_id = ? ORDER BY day DESC LIMIT 1",
+                            (session['user_id'],)).fetchone()
+        if last:
+            machine = conn.execute("SELECT * FROM machines WHERE id = ?", (last['assigned_to_machine_id'],)).fetchone()
+    return jsonify({"machine": dict(machine) if machine else None, "tasks_today": [dict(t) for t in tasks_today]})
+
+
+@benchmark("dashboard")
+def bench_dashboard(args):
+    """
+    /api/dashboard_data p50/p99 with --operators operators polling concurrently
+    (every 10th action a cycle update): three queries vs one query vs one query
+    with the per-user cache. E.g. --operators 500 --rows 200000.
+    """
+    import uuid
+    from datetime import date
+    import app as app_module
+    from dashboard_cache import DashboardCache
+    from db_pool import ConnectionPool
+
+    db_path = scratch_db()
+    conn = sqlite3.connect(db_path)
+    user_ids = fill_tasks(conn, args.rows, users=args.operators)
+    predefined_id, machine_id = conn.execute("SELECT (SELECT id FROM predefined_tasks), (SELECT id FROM machines)").fetchone()
+    today = date.today().isoformat()
+    todays_tasks = {uid: [str(uuid.uuid4()) for _ in range(3)] for uid in user_ids[::2]}   # half have tasks today
+    conn.executemany(
+        "INSERT INTO tasks (id, predefined_task_id, status, day, task_volume, assigned_to_user_id, assigned_to_machine_id, created_at) "
+        "VALUES (?, ?, 'Pending', ?, 100, ?, ?, ?)",
+        [(tid, predefined_id, today, uid, machine_id, today) for uid, ids in todays_tasks.items() for tid in ids],
+    )
+    conn.commit()
+    app_module.db_pool = app_module.cycle_writer.pool = ConnectionPool(db_path)
+    views = app_module.app.view_functions
+    current_view = views['get_dashboard_data']
+    clients = [logged_in_client(app_module.app, f"BENCH{i:04d}") for i in range(len(user_ids))]
+
+    modes = (
+        ("three queries", app_module.login_required(legacy_dashboard_data), 0.0),
+        ("one query", current_view, 0.0),
+        ("one query + cache", current_view, app_module.dashboard_cache.ttl),
+    )
+    # Every version gives the same answers, for a sample of operators.
+    answers = []
+    for label, view, ttl in modes:
+        views['get_dashboard_data'] = view
+        app_module.dashboard_cache = DashboardCache(ttl=ttl)
+        answers.append([client.get('/api/dashboard_data').json for client in clients[:50]])
+    assert all(a == answers[0] for a in answers), "dashboard versions disagree"
+
+    for label, view, ttl in modes:
+        views['get_dashboard_data'] = view
+        app_module.dashboard_cache = DashboardCache(ttl=ttl)
+        latencies = [[] for _ in clients]
+        deadline = time.perf_counter() + args.seconds
+
+        def operator(i, client, task_ids):
+            actions = 0
+            while time.perf_counter() < deadline:
+                actions += 1
+                if task_ids and actions % 10 == 0:
+                    client.post('/api/task/update_cycles', json={'task_id': task_ids[actions % 3], 'current_cycles': actions})
+                else:
+                    start = time.perf_counter()
+                    client.get('/api/dashboard_data')
+                    latencies[i].append(time.perf_counter() - start)
+                time.sleep(args.think)
+
+        threads = [threading.Thread(target=operator, args=(i, c, todays_tasks.get(uid)))
+                   for i, (c, uid) in enumerate(zip(clients, user_ids))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        samples = sorted(l for per_operator in latencies for l in per_operator)
+        p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+        print(f"{label:>18}: {len(samples) / args.seconds:7.1f} loads/s  p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:8.2f} ms  "
+              f"(cache hit rate {app_module.dashboard_cache.stats()['hit_rate']:.0%})")
+    views['get_dashboard_data'] = current_view
+
+
+def cycles_child(db_path, exit_mode, counts, operator_id_str='BENCH0000'):
+    """Runs in a subprocess for bench_cycles: taps the operator's first task today with each count, then exits normally or is SIGKILLed."""
+    import signal
+    import app as app_module
+    from db_pool import ConnectionPool
+
+    app_module.db_pool = app_module.cycle_writer.pool = ConnectionPool(db_path)
+    app_module.model_registry.warm = lambda: None   # no model load competing with the taps
+    client = logged_in_client(app_module.app, operator_id_str)
+    task_id = client.get('/api/dashboard_data').json['tasks_today'][0]['id']
+    for n in counts:
+        client.post('/api/task/update_cycles', json={'task_id': task_id, 'current_cycles': n})
+    print(task_id, flush=True)
+    if exit_mode == 'kill':
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+@benchmark("cycles")
+def bench_cycles(args):
+    """
+    Cycle-counter taps from --operators operators (--think seconds apart): a
+    commit per tap vs coalesced writes. Then checks that reads see pending
+    counts, that the final counts are written, and what survives a normal exit
+    vs a SIGKILL. E.g. --operators 100 --think 0.1.
+    """
+    import json
+    import subprocess
+    import sys
+    import uuid
+    import app as app_module
+    from db_pool import ConnectionPool
+
+    db_path = scratch_db()
+    conn = sqlite3.connect(db_path)
+    user_ids = fill_tasks(conn, 0, users=args.operators)
+    predefined_id, machine_id = conn.execute("SELECT (SELECT id FROM predefined_tasks), (SELECT id FROM machines)").fetchone()
+    task_of = {uid: str(uuid.uuid4()) for uid in user_ids}
+    conn.executemany(
+        "INSERT INTO tasks (id, predefined_task_id, status, day, task_volume, assigned_to_user_id, assigned_to_machine_id, created_at) "
+        "VALUES (?, ?, 'In Progress', date('now'), 100, ?, ?, datetime('now'))",
+        [(task_id, predefined_id, uid, machine_id) for uid, task_id in task_of.items()],
+    )
+    conn.commit()
+    app_module.db_pool = app_module.cycle_writer.pool = ConnectionPool(db_path)
+    views = app_module.app.view_functions
+    coalesced_view = views['update_task_cycles']
+    clients = [logged_in_client(app_module.app, f"BENCH{i:04d}") for i in range(len(user_ids))]
+
+    for label, view in (("commit per tap", app_module.login_required(legacy_update_cycles)), ("coalesced", coalesced_view)):
+        views['update_task_cycles'] = view
+        flushes_before = app_module.cycle_writer.flushes
+        latencies = [[] for _ in clients]
+        last_value = {}
+        deadline = time.perf_counter() + args.seconds
+
+        def operator(i, client, user_id):
+            n = 0
+            while time.perf_counter() < deadline:
+                n += 1
+                start = time.perf_counter()
+                client.post('/api/task/update_cycles', json={'task_id': task_of[user_id], 'current_cycles': n})
+                latencies[i].append(time.perf_counter() - start)
+                last_value[task_of[user_id]] = n
+                time.sleep(args.think)
+
+        threads = [threading.Thread(target=operator, args=(i, c, uid)) for i, (c, uid) in enumerate(zip(clients, user_ids))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        app_module.cycle_writer.flush()
+        samples = sorted(l for per_operator in latencies for l in per_operator)
+        commits = len(samples) if view is not coalesced_view else app_module.cycle_writer.flushes - flushes_before
+        print(f"{label:>15}: {len(samples) / args.seconds:8.1f} taps/s  p50 {samples[len(samples) // 2] * 1000:6.2f} ms  "
+              f"p99 {samples[int(len(samples) * 0.99)] * 1000:7.2f} ms  {commits} commits for {len(samples)} taps")
+        stored = dict(conn.execute("SELECT id, current_cycles FROM tasks WHERE id IN (%s)" % ','.join('?' * len(last_value)),
+                                   list(last_value)).fetchall())
+        assert all(stored[task_id] == n for task_id, n in last_value.items()), f"{label}: final counts not written"
+    print("final counts written: ok")
+
+    # Read-your-writes: the dashboard shows a tap before it is committed (BENCH0000's task is dated today).
+    client = logged_in_client(app_module.app, 'BENCH0000')
+    task_id = client.get('/api/dashboard_data').json['tasks_today'][0]['id']
+    client.post('/api/task/update_cycles', json={'task_id': task_id, 'current_cycles': 4242})
+    shown = {t['id']: t['current_cycles'] for t in client.get('/api/dashboard_data').json['tasks_today']}[task_id]
+    committed = conn.execute("SELECT current_cycles FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+    assert shown == 4242, shown
+    print(f"pending tap visible to reads: ok (dashboard {shown}, database {committed})")
+    app_module.cycle_writer.flush()
+
+    # Bad input is refused up front; a value SQLite rejects anyway costs only its own row.
+    for body in ({'task_id': task_id}, {'task_id': task_id, 'current_cycles': None}, {'current_cycles': 5}):
+        assert client.post('/api/task/update_cycles', json=body).status_code == 400, body
+    app_module.cycle_writer.update(user_ids[1], task_of[user_ids[1]], None)
+    client.post('/api/task/update_cycles', json={'task_id': task_id, 'current_cycles': 777})
+    app_module.cycle_writer.flush()
+    stats = app_module.cycle_writer.stats()
+    assert conn.execute("SELECT current_cycles FROM tasks WHERE id = ?", (task_id,)).fetchone()[0] == 777
+    assert stats['pending'] == 0 and stats['rows_dropped'] == 1, stats
+    print("invalid taps: 400; a rejected row is dropped without holding back the batch: ok")
+
+    for exit_mode, counts in (('exit', range(1, 51)), ('kill', range(101, 151))):
+        child = subprocess.run([sys.executable, '-c', f'import benchmark; benchmark.cycles_child({json.dumps(db_path)}, "{exit_mode}", {list(counts)}, "BENCH0000")'],
+                               capture_output=True, text=True)
+        task_id = child.stdout.strip().splitlines()[-1]
+        count = conn.execute("SELECT current_cycles FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+        print(f"taps up to {counts[-1]}, then {'normal exit' if exit_mode == 'exit' else 'SIGKILL'}: {count:g} stored"
+              f"{'' if exit_mode == 'exit' else f' (taps of the last {app_module.cycle_writer.flush_interval}s may be lost)'}")
+        if exit_mode == 'exit':
+            assert count == counts[-1], count
+
+
+def start_asgi_server(asgi_app):
+    """
+    Serves an ASGI app on a free local port from a background event loop; returns the port.
+    A bare HTTP/1.1 front end (one request per connection) so the benchmark runs
+    without an ASGI server installed; deployments use uvicorn or similar.
+    """
+    import asyncio
+    from urllib.parse import unquote
+
+    async def handle(reader, writer):
+        try:
+            head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            method, target, _ = head[0].split(' ', 2)
+            headers = [(k.strip().lower().encode('latin-1'), v.strip().encode('latin-1'))
+                       for k, v in (line.split(':', 1) for line in head[1:] if line)]
+            length = int(dict(headers).get(b'content-length', 0))
+            body = await reader.readexactly(length) if length else b''
+            path, _, query = target.partition('?')
+            requested = []
+
+            async def receive():
+                if not requested:
+                    requested.append(True)
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+                await reader.read()   # b'' once the client hangs up
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    writer.write(f"HTTP/1.1 {message['status']} -\r\n".encode() +
+                                 b''.join(k + b': ' + v + b'\r\n' for k, v in message['headers']) + b'connection: close\r\n\r\n')
+                else:
+                    writer.write(message.get('body', b''))
+                    await writer.drain()
+
+            scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+                     'path': unquote(path), 'raw_path': path.encode('latin-1'), 'query_string': query.encode('latin-1'),
+                     'root_path': '', 'headers': headers, 'client': writer.get_extra_info('peername'),
+                     'server': writer.get_extra_info('sockname')}
+            await asgi_app(scope, receive, send)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.new_event_loop()
+    ports = []
+    started = threading.Event()
+
+    async def serve():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0, backlog=4096)
+        ports.append(server.sockets[0].getsockname()[1])
+        started.set()
+        await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    started.wait()
+    return ports[0]
+
+
+def start_sync_server(wsgi_app):
+    """The threaded Werkzeug server app.run() uses, on a free local port; returns (server, port)."""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port
+
+
+@benchmark("asgi")
+def bench_asgi(args):
+    """
+    Capacity with --streams status streams (SSE) held open: threads, memory and
+    /api/status latency under the threaded sync server vs the ASGI app.
+    """
+    import http.client
+    import logging
+    import socket
+    import asgi
+    import app as app_module
+    from db_pool import ConnectionPool
+
+    pool = ConnectionPool(scratch_db())
+    app_module.db_pool = app_module.cycle_writer.pool = app_module.status_watcher.pool = pool
+    app_module.model_registry.warm = lambda: None   # no model load competing for the CPU
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    def request(port, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response
+
+    sync_server, sync_port = start_sync_server(app_module.app)
+    for label, port in (("sync (threaded)", sync_port), ("asgi", start_asgi_server(asgi.app))):
+        login = request(port, 'POST', '/login', '{"operator_id_str": "OP1001", "password": "pass"}',
+                        {'Content-Type': 'application/json'})
+        cookie = login.getheader('Set-Cookie').split(';', 1)[0]
+        threads_before, memory_before = threading.active_count(), memory_usage()['rss']
+
+        streams, connected = [], 0
+        for _ in range(args.streams):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f"GET /api/status/EXC001/stream HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n".encode())
+            streams.append(sock)
+        deadline = time.perf_counter() + 30
+        for sock in streams:
+            received = b''
+            try:
+                while b'event: status' not in received:
+                    sock.settimeout(max(0.1, deadline - time.perf_counter()))
+                    received += sock.recv(65536)
+                connected += 1
+            except socket.timeout:
+                pass
+
+        latencies = []
+
+        def poll_status():
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                assert request(port, 'GET', '/api/status/EXC001', headers={'Cookie': cookie}).status == 200
+                latencies.append(time.perf_counter() - start)
+
+        pollers = [threading.Thread(target=poll_status) for _ in range(args.readers)]
+        for t in pollers:
+            t.start()
+        for t in pollers:
+            t.join()
+        latencies.sort()
+        print(f"{label:>16}: {connected}/{args.streams} streams live, "
+              f"+{threading.active_count() - threads_before} threads, +{memory_usage()['rss'] - memory_before:.1f} MB, "
+              f"/api/status p50 {latencies[len(latencies) // 2] * 1000:.2f} ms p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+        for sock in streams:
+            sock.close()
+        # Let the servers notice the hang-ups (and the sync server's threads exit) before the next run.
+        deadline = time.perf_counter() + 60
+        while threading.active_count() > threads_before + 10 and time.perf_counter() < deadline:
+            time.sleep(0.2)
+    sync_server.shutdown()
+
+
+def legacy_training_materials(machine_model):
+    """/api/training/<model> before the reference cache: a query and a jsonify per call."""
+    from flask import jsonify
+    import app as app_module
+
+    materials = app_module.get_db_connection().execute(
+        "SELECT * FROM training_modules WHERE associated_machine_model = ? OR associated_machine_model = 'All'",
+        (machine_model,)
+    ).fetchall()
+    return jsonify([dict(m) for m in materials])
+
+
+@benchmark("reference")
+def bench_reference(args):
+    """
+    /api/training/<model> with --batch modules: query + jsonify vs the reference
+    cache (200) vs conditional requests answered 304. Then checks that the ETag
+    only changes when the reference tables do.
+    """
+    import uuid
+    import app as app_module
+    from db_pool import ConnectionPool
+    from reference_cache import ReferenceCache
+
+    db_path = scratch_db()
+    conn = sqlite3.connect(db_path)
+    model = 'Caterpillar 336 Excavator'
+    conn.executemany("INSERT INTO training_modules (id, title, module_type, url, associated_machine_model) VALUES (?, ?, 'Video', ?, ?)",
+                     [(str(uuid.uuid4()), f"Benchmark module {i}", f"https://example.com/{i}", model) for i in range(args.batch)])
+    conn.commit()
+    app_module.db_pool = app_module.cycle_writer.pool = ConnectionPool(db_path)
+    app_module.reference_cache = ReferenceCache(db_path)
+    app_module.model_registry.warm = lambda: None
+    views = app_module.app.view_functions
+    cached_view = views['get_training_materials']
+    legacy_view = app_module.login_required(legacy_training_materials)
+    client = logged_in_client(app_module.app)
+    path = f'/api/training/{model}'
+
+    views['get_training_materials'] = legacy_view
+    legacy_body = client.get(path).data
+    views['get_training_materials'] = cached_view
+    first = client.get(path)
+    assert first.data == legacy_body, "cached body differs from jsonify's"
+    etag = first.headers['ETag']
+
+    for label, headers, view in (
+        ("query + jsonify", {}, legacy_view),
+        ("cached 200", {}, cached_view),
+        ("If-None-Match 304", {'If-None-Match': etag}, cached_view),
+        ("If-Modified-Since", {'If-Modified-Since': first.headers['Last-Modified']}, cached_view),
+    ):
+        views['get_training_materials'] = view
+        start = time.perf_counter()
+        for _ in range(args.repeat * 50):
+            response = client.get(path, headers=headers)
+        elapsed = (time.perf_counter() - start) / (args.repeat * 50)
+        print(f"{label:>17}: {elapsed * 1e6:8.1f} us/request  status {response.status_code}  {len(response.data)} bytes")
+    views['get_training_materials'] = cached_view
+
+    task_id = conn.execute("SELECT id FROM tasks LIMIT 1").fetchone()[0]
+    conn.execute("UPDATE tasks SET current_cycles = current_cycles + 1 WHERE id = ?", (task_id,))
+    conn.commit()
+    time.sleep(app_module.reference_cache.check_interval)
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    print("unrelated write: still 304")
+    conn.execute("UPDATE training_modules SET title = 'Renamed' WHERE title = 'Benchmark module 0'")
+    conn.commit()
+    time.sleep(app_module.reference_cache.check_interval)
+    changed = client.get(path, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag and b'Renamed' in changed.data
+    print(f"training_modules update: 200 with a new ETag, Last-Modified {changed.headers['Last-Modified']}")
+
+
+@benchmark("encoding")
+def bench_encoding(args):
+    """
+    Payload size and serialization time per JSON API endpoint, for every
+    representation (JSON, compact JSON, MessagePack if installed) and content
+    coding (identity, gzip, br if installed), plus the full request time.
+    The operator gets --rows / --operators tasks; e.g. --rows 20000 --operators 10.
+    """
+    import gzip
+    import json
+    import uuid
+    from datetime import date
+    import app as app_module
+    import negotiation
+    from db_pool import ConnectionPool
+    from reference_cache import ReferenceCache
+    from status_cache import LatestStatusCache
+
+    db_path = scratch_db()
+    conn = sqlite3.connect(db_path)
+    user_ids = fill_tasks(conn, args.rows, users=args.operators)
+    predefined_id, machine_id = conn.execute("SELECT (SELECT id FROM predefined_tasks), (SELECT id FROM machines)").fetchone()
+    today = date.today().isoformat()
+    conn.executemany(
+        "INSERT INTO tasks (id, predefined_task_id, status, day, task_volume, assigned_to_user_id, assigned_to_machine_id, created_at) "
+        "VALUES (?, ?, 'Pending', ?, 100, ?, ?, ?)",
+        [(str(uuid.uuid4()), predefined_id, today, user_ids[0], machine_id, today) for _ in range(8)],
+    )
+    conn.commit()
+    app_module.db_pool = app_module.cycle_writer.pool = ConnectionPool(db_path)
+    app_module.reference_cache = ReferenceCache(db_path)
+    app_module.status_cache = LatestStatusCache(db_path)
+    app_module.model_registry.warm = lambda: None
+    client = logged_in_client(app_module.app, 'BENCH0000')
+    dumps = app_module.app.json.dumps
+
+    year_ago = date.today().replace(day=1, year=date.today().year - 1).strftime('%Y-%m')
+    endpoints = [
+        f'/api/tasks_for_month?month={year_ago}&months=12',
+        '/api/dashboard_data',
+        '/api/predefined_tasks',
+        '/api/training/Caterpillar 336 Excavator',
+        '/api/fleet/status',
+    ]
+    repeat = args.repeat * 5
+    for path in endpoints:
+        obj = client.get(path).json
+        print(f"\n{path}")
+        print(f"{'representation':>16} {'coding':>8} {'bytes':>9} {'encode us':>10} {'request us':>11}")
+        for mimetype in negotiation.representations():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                body = negotiation.serialize(obj, mimetype, dumps)
+            encode_time = (time.perf_counter() - start) / repeat
+            for coding in ['identity'] + negotiation.encodings():
+                headers = {'Accept': mimetype, 'Accept-Encoding': coding}
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    response = client.get(path, headers=headers)
+                request_time = (time.perf_counter() - start) / repeat
+                data = response.data
+                # What the client decodes must be what plain JSON says.
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                elif response.headers.get('Content-Encoding') == 'br':
+                    data = negotiation.brotli.decompress(data)
+                if mimetype == negotiation.MSGPACK:
+                    decoded = negotiation.msgpack.unpackb(data)
+                else:
+                    decoded = negotiation.from_compact(json.loads(data)) if mimetype == negotiation.COMPACT_JSON else json.loads(data)
+                assert decoded == obj, f"{path} as {mimetype} / {coding} decodes differently"
+                assert response.mimetype == mimetype
+                size, coding_time = len(body), 0.0
+                if coding != 'identity' and len(body) >= negotiation.MIN_COMPRESS_BYTES:
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        compressed = negotiation.compress(body, coding)
+                    coding_time = (time.perf_counter() - start) / repeat
+                    size = len(compressed)
+                assert size == len(response.data)
+                label = mimetype.split('/')[1].replace('vnd.operator-assistant.', '')
+                print(f"{label:>16} {coding:>8} {size:>9} {(encode_time + coding_time) * 1e6:>10.1f} {request_time * 1e6:>11.1f}")
+
+    # A gzip response's ETag revalidates with 304, and is distinct from the identity one.
+    path = '/api/fleet/status'
+    plain = client.get(path)
+    zipped = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    if zipped.headers.get('Content-Encoding') == 'gzip':
+        assert zipped.headers['ETag'] != plain.headers['ETag']
+        again = client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+        assert again.status_code == 304 and again.headers['ETag'] == zipped.headers['ETag']
+        print(f"\ngzip ETag {zipped.headers['ETag']} revalidates with 304; Vary: {zipped.headers['Vary']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--operators', type=int, default=500)
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--think', type=float, default=1.0, help="seconds between an operator's requests")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == '__main__':
+    main()
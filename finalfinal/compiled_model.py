@@ -0,0 +1,132 @@
+# compiled_model.py
+"""
+Low-overhead inference for the task-time pipeline built in ml_predictor.py.
+
+At model load the fitted StandardScaler, OneHotEncoder and RandomForestRegressor
+are flattened into plain NumPy arrays, so a prediction skips DataFrame
+construction, ColumnTransformer dispatch and the forest's thread pool. The
+arithmetic mirrors scikit-learn's (float64 scaling, float32 features compared
+against float64 thresholds, leaf means averaged over trees), so predictions
+match model.predict up to float summation order.
+"""
+import os
+
+import joblib
+import numpy as np
+
+TREE_LEAF = -1
+
+
+class CompiledPipeline:
+    def __init__(self, pipeline):
+        preprocessor = pipeline.named_steps['preprocessor']
+        forest = pipeline.named_steps['regressor']
+
+        transformers = {name: (transformer, columns) for name, transformer, columns in preprocessor.transformers_}
+        scaler, self.numeric_columns = transformers['num']
+        encoder, self.categorical_columns = transformers['cat']
+        if encoder.handle_unknown != 'ignore' or encoder.drop is not None:
+            raise ValueError("only OneHotEncoder(handle_unknown='ignore') without drop can be compiled")
+        self.mean = scaler.mean_ if scaler.with_mean else np.zeros(len(self.numeric_columns))
+        self.scale = scaler.scale_ if scaler.with_std else np.ones(len(self.numeric_columns))
+
+        # One dict per categorical column: category value -> output column index.
+        offset = len(self.numeric_columns)
+        self.category_index = []
+        for categories in encoder.categories_:
+            self.category_index.append({c.item() if hasattr(c, 'item') else c: offset + i for i, c in enumerate(categories)})
+            offset += len(categories)
+        self.n_features = offset
+
+        # All trees concatenated into flat node arrays; child indices are made global.
+        lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+        base = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == TREE_LEAF
+            # A leaf points at itself, so finished rows stay put while others descend.
+            node_ids = np.arange(tree.node_count) + base
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + base))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + base))
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            values.append(tree.value[:, 0, 0])
+            roots.append(base)
+            base += tree.node_count
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots)
+        self.depth = max(estimator.tree_.max_depth for estimator in forest.estimators_)
+
+    def transform(self, records):
+        """Feature matrix (float32, like the forest sees it) for a list of feature dicts."""
+        X = np.zeros((len(records), self.n_features), dtype=np.float32)
+        numeric = np.array([[float(r[c]) for c in self.numeric_columns] for r in records], dtype=np.float64)
+        X[:, :len(self.numeric_columns)] = (numeric - self.mean) / self.scale
+        for row, record in enumerate(records):
+            for column, index in zip(self.categorical_columns, self.category_index):
+                position = index.get(record[column])
+                if position is not None:
+                    X[row, position] = 1.0
+        return X
+
+    def predict(self, records):
+        """Predicted durations for a list of feature dicts (the columns ml_predictor trains on)."""
+        X = self.transform(records)
+        rows = np.arange(len(records))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(records), len(self.roots)))
+        # Walk every tree for every row at once; depth steps reach all leaves.
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # Sequential sum over trees (cumsum), then average, as the forest does.
+        return np.cumsum(self.value[nodes], axis=1)[:, -1] / len(self.roots)
+
+
+def compile_pipeline(pipeline):
+    """Returns a CompiledPipeline, or None when the pipeline's shape isn't supported."""
+    try:
+        return CompiledPipeline(pipeline)
+    except (AttributeError, KeyError, ValueError) as e:
+        print(f"Model cannot be compiled, using model.predict: {e}")
+        return None
+
+
+def compiled_path(model_path):
+    """Sidecar file holding the compiled arrays for a saved pipeline."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.compiled{ext}"
+
+
+def save_compiled(compiled, path):
+    """Writes a CompiledPipeline uncompressed (so it can be memory-mapped), atomically."""
+    tmp_path = path + ".tmp"
+    joblib.dump(compiled, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_shared(path):
+    """
+    Loads a saved CompiledPipeline with its arrays memory-mapped read-only.
+    Every worker mapping the same file shares one copy in the page cache
+    instead of holding a private forest.
+    """
+    return joblib.load(path, mmap_mode='r')
+
+if __name__ == '__main__':
+    # Self-check: the compiled model must agree with model.predict on the training data.
+    from feature_store import add_training_features
+    from ml_predictor import MODEL_PATH, FEATURE_COLUMNS, get_training_data
+
+    pipeline = joblib.load(MODEL_PATH)
+    df = add_training_features(*get_training_data())[FEATURE_COLUMNS]
+    expected = pipeline.predict(df)
+    compiled = compile_pipeline(pipeline)
+    if compiled is None:
+        raise SystemExit("Nothing to check: this model is served by model.predict.")
+    actual = compiled.predict(df.to_dict('records'))
+    assert np.allclose(actual, expected, rtol=1e-12, atol=0), f"max difference {np.abs(actual - expected).max()}"
+    print(f"Compiled model matches model.predict on {len(df)} rows (max difference {np.abs(actual - expected).max()}).")
@@ -0,0 +1,124 @@
+# cycle_writer.py
+"""
+Write coalescing for /api/task/update_cycles.
+
+Operators tap the cycle counter many times a minute, and only the newest
+count matters. CycleWriter keeps the latest value per (operator, task) in
+memory. A background thread writes whatever has accumulated every
+FLUSH_INTERVAL_SEC, as one executemany in one transaction, so a burst of taps
+costs one UPDATE per task and one commit per interval.
+
+Reads: latest(user_id) returns the values not yet committed, and
+/api/dashboard_data overlays them. An operator always sees their newest count
+from the worker that took the tap.
+
+Durability: update_cycles returns before the value is committed.
+- A normal shutdown (interpreter exit, gunicorn graceful stop) writes
+  everything pending through the atexit flush registered in app.py.
+- A hard crash (SIGKILL, power loss) loses at most the taps of the last
+  FLUSH_INTERVAL_SEC. The counter is the only column written here and is
+  progress information, so losing a fraction of a second of it is acceptable.
+- A flush that fails as a whole (e.g. the database is locked) keeps its values
+  and retries at the next interval, unless a newer tap for the same task
+  arrived meanwhile.
+- A value SQLite rejects fails only its own row: the batch is rewritten row by
+  row and the rejected rows are dropped (and counted), so one bad value cannot
+  hold back every other operator's taps.
+`python benchmark.py cycles` checks all of these.
+"""
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURATION ---
+FLUSH_INTERVAL_SEC = 0.5
+
+UPDATE_CYCLES_SQL = "UPDATE tasks SET current_cycles = ? WHERE id = ? AND assigned_to_user_id = ?"
+
+
+class CycleWriter:
+    def __init__(self, pool, flush_interval=FLUSH_INTERVAL_SEC):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.on_flush = []          # callables(list of (user_id, task_id, cycles)) run after each commit
+        self._pending = {}          # (user_id, task_id) -> newest cycles, not yet being written
+        self._flushing = {}         # the batch being written right now
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.updates = self.flushes = self.rows_written = self.rows_dropped = 0
+
+    def update(self, user_id, task_id, cycles):
+        """Records a new cycle count; it is committed within flush_interval seconds."""
+        with self._lock:
+            self._pending[(user_id, task_id)] = cycles
+            self.updates += 1
+            if self._thread is None or not self._thread.is_alive():
+                # Started on first use so each forked worker gets its own writer.
+                self._thread = threading.Thread(target=self._run, name='cycle-writer', daemon=True)
+                self._thread.start()
+
+    def latest(self, user_id):
+        """{task_id: cycles} for this operator's counts that are not committed yet."""
+        with self._lock:
+            values = {task_id: cycles for (user, task_id), cycles in self._flushing.items() if user == user_id}
+            values.update((task_id, cycles) for (user, task_id), cycles in self._pending.items() if user == user_id)
+            return values
+
+    def flush(self):
+        """Writes everything pending in one transaction. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return 0
+            rows = [(user_id, task_id, cycles) for (user_id, task_id), cycles in batch.items()]
+            try:
+                with self.pool.connection() as conn:
+                    try:
+                        conn.executemany(UPDATE_CYCLES_SQL, [(cycles, task_id, user_id) for user_id, task_id, cycles in rows])
+                    except (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError):
+                        conn.rollback()
+                        rows = self._write_each(conn, rows)
+                    conn.commit()
+            except Exception:
+                with self._lock:
+                    # Retry next time, unless a newer tap replaced the value meanwhile.
+                    for key, cycles in batch.items():
+                        self._pending.setdefault(key, cycles)
+                    self._flushing = {}
+                raise
+            for hook in self.on_flush:
+                hook(rows)
+            with self._lock:
+                self._flushing = {}
+                self.flushes += 1
+                self.rows_written += len(rows)
+            return len(rows)
+
+    def _write_each(self, conn, rows):
+        """Writes rows one at a time in the open transaction; returns those SQLite accepted."""
+        written = []
+        for user_id, task_id, cycles in rows:
+            try:
+                conn.execute(UPDATE_CYCLES_SQL, (cycles, task_id, user_id))
+                written.append((user_id, task_id, cycles))
+            except (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError) as e:
+                print(f"Cycle write dropped for task {task_id!r}: {e}")
+        with self._lock:
+            self.rows_dropped += len(rows) - len(written)
+        return written
+
+    def stats(self):
+        with self._lock:
+            return {"updates": self.updates, "flushes": self.flushes, "rows_written": self.rows_written,
+                    "rows_dropped": self.rows_dropped, "pending": len(self._pending)}
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Cycle write error: {e}")
@@ -0,0 +1,106 @@
+# dashboard_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+TTL_SEC = 3.0
+MAX_USERS = 10000
+
+# Today's tasks for one operator plus the machine to show: the machine of the
+# first task in display order, otherwise the one from their latest task. One
+# row per task; a single row with NULL task columns when there are none.
+DASHBOARD_QUERY = """
+    WITH today AS (
+        SELECT t.id, t.status, t.task_volume as target_cycles, t.current_cycles, pt.name as title,
+            t.assigned_to_machine_id, t.created_at,
+            CASE t.status WHEN 'In Progress' THEN 1 WHEN 'Pending' THEN 2 ELSE 3 END AS status_rank
+        FROM tasks t
+        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
+        WHERE t.assigned_to_user_id = ? AND t.day = ?
+    )
+    SELECT today.id, today.status, today.target_cycles, today.current_cycles, today.title, today.assigned_to_machine_id,
+        m.id AS machine_id, m.machine_id_str, m.model AS machine_model
+    FROM (SELECT COALESCE(
+            (SELECT assigned_to_machine_id FROM today ORDER BY status_rank, created_at LIMIT 1),
+            (SELECT assigned_to_machine_id FROM tasks WHERE assigned_to_user_id = ? ORDER BY day DESC LIMIT 1)
+        ) AS id) pick
+    LEFT JOIN machines m ON m.id = pick.id
+    LEFT JOIN today ON 1
+    ORDER BY today.status_rank, today.created_at
+"""
+
+TASK_COLUMNS = ('id', 'status', 'target_cycles', 'current_cycles', 'title', 'assigned_to_machine_id')
+
+
+def load_dashboard(conn, user_id, day):
+    """The /api/dashboard_data payload for one operator and day, from one query."""
+    rows = conn.execute(DASHBOARD_QUERY, (user_id, day, user_id)).fetchall()
+    first = rows[0]
+    machine = None
+    if first['machine_id'] is not None:
+        machine = {"id": first['machine_id'], "machine_id_str": first['machine_id_str'], "model": first['machine_model']}
+    return {
+        "machine": machine,
+        "tasks_today": [{c: row[c] for c in TASK_COLUMNS} for row in rows if row['id'] is not None],
+    }
+
+
+class DashboardCache:
+    """
+    Per-operator cache of the dashboard payload. The task write endpoints call
+    invalidate() for the operator they changed, so this worker never serves a
+    payload older than its own writes. Writes handled by another worker process
+    are not seen here; those show up once the entry expires after ttl seconds.
+
+    Each operator has a generation that invalidate() bumps. get() returns it and
+    put() only stores when it is unchanged, so a read that raced with a write
+    cannot cache the pre-write payload.
+    """
+
+    def __init__(self, ttl=TTL_SEC, max_users=MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()   # user_id -> (expires_at, day, payload)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, user_id, day):
+        """(cached payload or None, generation to pass to put())."""
+        with self._lock:
+            generation = self._generations.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != day:
+                self.misses += 1
+                return None, generation
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[2], generation
+
+    def put(self, user_id, day, payload, generation):
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, day, payload)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl_sec": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -1,9 +1,18 @@
 import sqlite3
+import sys
+import re
 import uuid
 from datetime import datetime, timedelta
 import random
 import numpy as np
 
+from dashboard_cache import DASHBOARD_QUERY
+from feature_store import PROFILE_QUERY
+from prediction_metrics import ACCURACY_QUERY
+from queries import LAST_CREATED_MACHINE_QUERY, LAST_TASK_MACHINE_QUERY, MONTH_TASKS_QUERY
+from status_stream import LATEST_STATUS_QUERY, LOGS_SINCE_QUERY
+from rollups import BUCKET_SQL, METRICS as ROLLUP_METRICS
+
 # Define the name of the database file
 DB_NAME = "operator_assistant.db"
 
@@ -18,44 +27,100 @@ def create_connection():
         print(f"Error connecting to database: {e}")
     return conn
 
-def create_tables(conn):
-    """Create all necessary tables for the application."""
-    cursor = conn.cursor()
-    tables_to_drop = [
-        "issue_reports", "training_modules", "machine_logs",
-        "tasks", "predefined_tasks", "machines", "users"
-    ]
-    for table in tables_to_drop:
-        cursor.execute(f"DROP TABLE IF EXISTS {table};")
-    print("Dropped existing tables for a fresh setup.")
+# --- SCHEMA MIGRATIONS ---
+# Each entry is one schema version; PRAGMA user_version records how many have
+# been applied, so an existing database is upgraded in place rather than rebuilt.
+# Never edit a migration that has shipped -- append a new one instead.
+def _feature_store_upsert(row, sign=''):
+    """Trigger statements adding (sign='') or removing (sign='-') one completed task's contribution."""
+    counted = f"{row}.status = 'Completed' AND {row}.actual_duration_minutes IS NOT NULL"
+    return "\n".join(f"""
+            INSERT INTO feature_store (entity, key, task_count, volume_sum, duration_sum, idling_sum, alert_sum)
+            SELECT '{entity}', {key}, {sign}1, {sign}{row}.task_volume, {sign}{row}.actual_duration_minutes,
+                {sign}COALESCE({row}.idling_time_min, 0), {sign}COALESCE({row}.safety_alerts_triggered, 0)
+            FROM {table} WHERE id = {row}.{fk} AND {counted}
+            ON CONFLICT (entity, key) DO UPDATE SET
+                task_count = task_count + excluded.task_count, volume_sum = volume_sum + excluded.volume_sum,
+                duration_sum = duration_sum + excluded.duration_sum, idling_sum = idling_sum + excluded.idling_sum,
+                alert_sum = alert_sum + excluded.alert_sum;""" for entity, key, table, fk in (
+        ('operator', 'operator_id_str', 'users', 'assigned_to_user_id'),
+        ('machine', 'machine_id_str', 'machines', 'assigned_to_machine_id'),
+    ))
+
+def _reference_version_triggers(table, counter=None, update_of=None):
+    """
+    Triggers bumping the reference_versions row `counter` (default: `table`) on
+    every insert, update (only of the `update_of` columns, if given) and delete.
+    """
+    name = table if counter is None else f"{table}_{counter}"
+    counter = counter or table
+    update = f"UPDATE OF {', '.join(update_of)}" if update_of else "UPDATE"
+    return [f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{name}_version_{event.lower()} AFTER {clause} ON {table}
+        BEGIN
+            UPDATE reference_versions SET version = version + 1, changed_at = strftime('%Y-%m-%dT%H:%M:%S', 'now')
+            WHERE table_name = '{counter}';
+        END;
+        """ for event, clause in (('INSERT', 'INSERT'), ('UPDATE', update), ('DELETE', 'DELETE'))]
 
-    # --- Table schemas are unchanged ---
-    cursor.execute("""
-        CREATE TABLE users (
+def _rollup_trigger():
+    """AFTER INSERT trigger folding each new machine_logs row into its minute, hour and day rollup buckets."""
+    values = ", ".join(f"NEW.{m}, NEW.{m}, NEW.{m}" for m in ROLLUP_METRICS)
+    merge = ", ".join(f"{m}_min = MIN({m}_min, excluded.{m}_min), {m}_max = MAX({m}_max, excluded.{m}_max), "
+                      f"{m}_sum = {m}_sum + excluded.{m}_sum" for m in ROLLUP_METRICS)
+    body = "".join(f"""
+            INSERT INTO machine_log_rollups VALUES (NEW.machine_id_str, '{resolution}', {bucket.format(ts='NEW.timestamp')}, 1, {values})
+            ON CONFLICT (machine_id_str, resolution, bucket) DO UPDATE SET reading_count = reading_count + 1, {merge};"""
+        for resolution, bucket in BUCKET_SQL)
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_machine_logs_rollups AFTER INSERT ON machine_logs
+        BEGIN{body}
+        END;
+        """
+
+def _rollup_backfill(resolution, bucket):
+    """Adds the rollup buckets missing for existing machine_logs rows; existing ones may cover archived rows, so they stay."""
+    bucket = bucket.format(ts='timestamp')
+    stats = ", ".join(f"MIN({m}), MAX({m}), SUM({m})" for m in ROLLUP_METRICS)
+    return f"""
+        INSERT INTO machine_log_rollups
+        SELECT machine_id_str, '{resolution}', {bucket}, COUNT(*), {stats}
+        FROM machine_logs
+        WHERE true
+        GROUP BY machine_id_str, {bucket}
+        ON CONFLICT (machine_id_str, resolution, bucket) DO NOTHING;
+        """
+
+MIGRATIONS = [
+    # 1: Initial schema. IF NOT EXISTS lets databases created by the old
+    # drop-and-recreate setup (user_version 0) adopt the versioned scheme.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
             operator_id_str TEXT NOT NULL UNIQUE,
             name TEXT NOT NULL,
             experience_level TEXT NOT NULL,
             password TEXT NOT NULL
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE machines (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS machines (
             id TEXT PRIMARY KEY,
             machine_id_str TEXT NOT NULL UNIQUE,
             model TEXT NOT NULL
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE predefined_tasks (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS predefined_tasks (
             id TEXT PRIMARY KEY,
             name TEXT NOT NULL UNIQUE,
             category TEXT NOT NULL,
             task_unit TEXT NOT NULL
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE tasks (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
             id TEXT PRIMARY KEY,
             predefined_task_id TEXT NOT NULL,
             status TEXT NOT NULL,
@@ -76,9 +141,9 @@ def create_tables(conn):
             FOREIGN KEY (assigned_to_user_id) REFERENCES users (id),
             FOREIGN KEY (assigned_to_machine_id) REFERENCES machines (id)
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE machine_logs (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS machine_logs (
             id TEXT PRIMARY KEY,
             machine_id_str TEXT NOT NULL,
             timestamp TEXT NOT NULL,
@@ -89,18 +154,18 @@ def create_tables(conn):
             engine_temp REAL NOT NULL,
             FOREIGN KEY (machine_id_str) REFERENCES machines (machine_id_str)
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE training_modules (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS training_modules (
             id TEXT PRIMARY KEY,
             title TEXT NOT NULL,
             module_type TEXT NOT NULL,
             url TEXT NOT NULL,
             associated_machine_model TEXT NOT NULL
         );
-    """)
-    cursor.execute("""
-        CREATE TABLE issue_reports (
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS issue_reports (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             machine_id TEXT,
             user_id TEXT NOT NULL,
@@ -110,10 +175,309 @@ def create_tables(conn):
             FOREIGN KEY (machine_id) REFERENCES machines (id),
             FOREIGN KEY (user_id) REFERENCES users (id)
         );
-    """)
+        """,
+    ],
+    # 2: Indexes for the hot access paths: a user's tasks by day (dashboard,
+    # calendar, last-used machine lookups, covered via the trailing columns),
+    # a user's tasks by creation time, and the latest log row per machine.
+    [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_day ON tasks (assigned_to_user_id, day, created_at, assigned_to_machine_id);",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks (assigned_to_user_id, created_at, assigned_to_machine_id);",
+        "CREATE INDEX IF NOT EXISTS idx_machine_logs_machine_ts ON machine_logs (machine_id_str, timestamp DESC);",
+    ],
+    # 3: latest_status holds the newest machine_logs row per machine, kept current
+    # by a trigger so every write path (seeding, ingestion) maintains it.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS latest_status (
+            id TEXT NOT NULL,
+            machine_id_str TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            seatbelt_status TEXT NOT NULL,
+            tilt_angle REAL NOT NULL,
+            visibility_percent INTEGER NOT NULL,
+            hydraulic_pressure REAL NOT NULL,
+            engine_temp REAL NOT NULL
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_machine_logs_latest_status AFTER INSERT ON machine_logs
+        BEGIN
+            INSERT INTO latest_status (id, machine_id_str, timestamp, seatbelt_status, tilt_angle, visibility_percent, hydraulic_pressure, engine_temp)
+            VALUES (NEW.id, NEW.machine_id_str, NEW.timestamp, NEW.seatbelt_status, NEW.tilt_angle, NEW.visibility_percent, NEW.hydraulic_pressure, NEW.engine_temp)
+            ON CONFLICT (machine_id_str) DO UPDATE SET
+                id = excluded.id, timestamp = excluded.timestamp, seatbelt_status = excluded.seatbelt_status,
+                tilt_angle = excluded.tilt_angle, visibility_percent = excluded.visibility_percent,
+                hydraulic_pressure = excluded.hydraulic_pressure, engine_temp = excluded.engine_temp
+            WHERE excluded.timestamp >= latest_status.timestamp;
+        END;
+        """,
+        """
+        INSERT INTO latest_status (id, machine_id_str, timestamp, seatbelt_status, tilt_angle, visibility_percent, hydraulic_pressure, engine_temp)
+        SELECT id, machine_id_str, timestamp, seatbelt_status, tilt_angle, visibility_percent, hydraulic_pressure, engine_temp
+        FROM machine_logs l
+        WHERE l.timestamp = (SELECT MAX(timestamp) FROM machine_logs WHERE machine_id_str = l.machine_id_str)
+        ON CONFLICT (machine_id_str) DO NOTHING;
+        """,
+    ],
+    # 4: Per-machine telemetry rollups (count, and min/max/sum per metric so
+    # partial aggregates can be merged) at minute, hour and day resolution.
+    # bucket is the ISO timestamp the bucket starts at.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS machine_log_rollups (
+            machine_id_str TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            reading_count INTEGER NOT NULL,
+            tilt_angle_min REAL NOT NULL,
+            tilt_angle_max REAL NOT NULL,
+            tilt_angle_sum REAL NOT NULL,
+            visibility_percent_min REAL NOT NULL,
+            visibility_percent_max REAL NOT NULL,
+            visibility_percent_sum REAL NOT NULL,
+            hydraulic_pressure_min REAL NOT NULL,
+            hydraulic_pressure_max REAL NOT NULL,
+            hydraulic_pressure_sum REAL NOT NULL,
+            engine_temp_min REAL NOT NULL,
+            engine_temp_max REAL NOT NULL,
+            engine_temp_sum REAL NOT NULL,
+            PRIMARY KEY (machine_id_str, resolution, bucket)
+        ) WITHOUT ROWID;
+        """,
+        """
+        INSERT INTO machine_log_rollups
+        SELECT machine_id_str, 'minute', substr(timestamp, 1, 16) || ':00', COUNT(*),
+            MIN(tilt_angle), MAX(tilt_angle), SUM(tilt_angle),
+            MIN(visibility_percent), MAX(visibility_percent), SUM(visibility_percent),
+            MIN(hydraulic_pressure), MAX(hydraulic_pressure), SUM(hydraulic_pressure),
+            MIN(engine_temp), MAX(engine_temp), SUM(engine_temp)
+        FROM machine_logs
+        GROUP BY machine_id_str, substr(timestamp, 1, 16) || ':00';
+        """,
+        """
+        INSERT INTO machine_log_rollups
+        SELECT machine_id_str, 'hour', substr(timestamp, 1, 13) || ':00:00', COUNT(*),
+            MIN(tilt_angle), MAX(tilt_angle), SUM(tilt_angle),
+            MIN(visibility_percent), MAX(visibility_percent), SUM(visibility_percent),
+            MIN(hydraulic_pressure), MAX(hydraulic_pressure), SUM(hydraulic_pressure),
+            MIN(engine_temp), MAX(engine_temp), SUM(engine_temp)
+        FROM machine_logs
+        GROUP BY machine_id_str, substr(timestamp, 1, 13) || ':00:00';
+        """,
+        """
+        INSERT INTO machine_log_rollups
+        SELECT machine_id_str, 'day', substr(timestamp, 1, 10) || 'T00:00:00', COUNT(*),
+            MIN(tilt_angle), MAX(tilt_angle), SUM(tilt_angle),
+            MIN(visibility_percent), MAX(visibility_percent), SUM(visibility_percent),
+            MIN(hydraulic_pressure), MAX(hydraulic_pressure), SUM(hydraulic_pressure),
+            MIN(engine_temp), MAX(engine_temp), SUM(engine_temp)
+        FROM machine_logs
+        GROUP BY machine_id_str, substr(timestamp, 1, 10) || 'T00:00:00';
+        """,
+    ],
+    # 5: Completed tasks in completion order, for incremental retraining's
+    # high-water-mark reads (ml_predictor.train_incremental).
+    [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks (completed_at, id);",
+    ],
+    # 6: Feature store: running sums over completed tasks (those with an
+    # actual duration) per operator and per machine, kept current by triggers
+    # so every write path maintains them. feature_store.py derives the model
+    # features from these sums.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS feature_store (
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            task_count INTEGER NOT NULL,
+            volume_sum REAL NOT NULL,
+            duration_sum REAL NOT NULL,
+            idling_sum REAL NOT NULL,
+            alert_sum REAL NOT NULL,
+            PRIMARY KEY (entity, key)
+        ) WITHOUT ROWID;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_feature_store_insert AFTER INSERT ON tasks
+        BEGIN{_feature_store_upsert('NEW')}
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_feature_store_update
+        AFTER UPDATE OF status, actual_duration_minutes, task_volume, idling_time_min, safety_alerts_triggered,
+            assigned_to_user_id, assigned_to_machine_id ON tasks
+        BEGIN{_feature_store_upsert('OLD', '-')}{_feature_store_upsert('NEW')}
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_feature_store_delete AFTER DELETE ON tasks
+        BEGIN{_feature_store_upsert('OLD', '-')}
+        END;
+        """,
+        """
+        INSERT INTO feature_store (entity, key, task_count, volume_sum, duration_sum, idling_sum, alert_sum)
+        SELECT 'operator', u.operator_id_str, COUNT(*), SUM(t.task_volume), SUM(t.actual_duration_minutes),
+            SUM(COALESCE(t.idling_time_min, 0)), SUM(COALESCE(t.safety_alerts_triggered, 0))
+        FROM tasks t JOIN users u ON t.assigned_to_user_id = u.id
+        WHERE t.status = 'Completed' AND t.actual_duration_minutes IS NOT NULL
+        GROUP BY u.operator_id_str;
+        """,
+        """
+        INSERT INTO feature_store (entity, key, task_count, volume_sum, duration_sum, idling_sum, alert_sum)
+        SELECT 'machine', m.machine_id_str, COUNT(*), SUM(t.task_volume), SUM(t.actual_duration_minutes),
+            SUM(COALESCE(t.idling_time_min, 0)), SUM(COALESCE(t.safety_alerts_triggered, 0))
+        FROM tasks t JOIN machines m ON t.assigned_to_machine_id = m.id
+        WHERE t.status = 'Completed' AND t.actual_duration_minutes IS NOT NULL
+        GROUP BY m.machine_id_str;
+        """,
+    ],
+    # 7: Prediction log: one row per duration prediction served (written in
+    # batches by prediction_metrics.PredictionLogger). A task scheduled from a
+    # prediction keeps its id in tasks.prediction_id, which is how the accuracy
+    # job pairs forecasts with actual durations.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS prediction_log (
+            id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            user_id TEXT,
+            task_type TEXT,
+            predicted_minutes REAL NOT NULL,
+            model_version INTEGER,
+            cached INTEGER NOT NULL DEFAULT 0,
+            source TEXT NOT NULL,
+            latency_ms REAL
+        );
+        """,
+        "ALTER TABLE tasks ADD COLUMN prediction_id TEXT;",
+    ],
+    # 8: A version counter (and UTC change time) per reference-data table,
+    # bumped by triggers on any change, so reference_cache.py knows when its
+    # in-memory copy of a table is stale.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS reference_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            changed_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        """
+        INSERT INTO reference_versions (table_name, version, changed_at)
+        VALUES ('predefined_tasks', 1, strftime('%Y-%m-%dT%H:%M:%S', 'now')),
+            ('training_modules', 1, strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+        ON CONFLICT (table_name) DO NOTHING;
+        """,
+        *_reference_version_triggers('predefined_tasks'),
+        *_reference_version_triggers('training_modules'),
+    ],
+    # 9: Telemetry rollups maintained by a trigger, like latest_status, so every
+    # writer of machine_logs (seed_data, scripts, the ingest endpoint) keeps
+    # them current. Buckets missing for rows written without them are filled in.
+    [
+        _rollup_trigger(),
+        *(_rollup_backfill(resolution, bucket) for resolution, bucket in BUCKET_SQL),
+    ],
+    # 10: User roles. 'admin' may run operations that affect every worker (model
+    # rollback); grant it with `python db.py --grant-admin <operator id>`.
+    [
+        "ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'operator';",
+    ],
+    # 11: A reference_versions counter for everything FeatureStore serves: the
+    # feature_store sums, user profiles, and which machine each user last had.
+    # The store reloads when it moves instead of on every commit, so telemetry,
+    # cycle and prediction log writes don't reach the predict path.
+    [
+        """
+        INSERT INTO reference_versions (table_name, version, changed_at)
+        VALUES ('feature_store', 1, strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+        ON CONFLICT (table_name) DO NOTHING;
+        """,
+        *_reference_version_triggers('feature_store'),
+        *_reference_version_triggers('users', 'feature_store', ['experience_level', 'operator_id_str']),
+        *_reference_version_triggers('machines', 'feature_store', ['machine_id_str']),
+        *_reference_version_triggers('tasks', 'feature_store', ['day', 'assigned_to_user_id', 'assigned_to_machine_id']),
+    ],
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
+def migrate(conn):
+    """Applies any pending migrations, each in its own transaction. Safe to call on every startup."""
+    applied = 0
+    while True:
+        # BEGIN IMMEDIATE takes the write lock before re-reading the version, so
+        # several workers starting at once apply each migration exactly once.
+        conn.execute("BEGIN IMMEDIATE")
+        version = get_schema_version(conn)
+        if version >= len(MIGRATIONS):
+            conn.rollback()
+            break
+        try:
+            for statement in MIGRATIONS[version]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied += 1
+        print(f"Applied schema migration {version + 1}.")
+    return applied
+
+def reset_database(conn):
+    """Drops every table and rebuilds the schema from scratch."""
+    cursor = conn.cursor()
+    tables_to_drop = [
+        "reference_versions", "prediction_log", "feature_store", "machine_log_rollups", "latest_status", "issue_reports", "training_modules", "machine_logs",
+        "tasks", "predefined_tasks", "machines", "users"
+    ]
+    for table in tables_to_drop:
+        cursor.execute(f"DROP TABLE IF EXISTS {table};")
+    cursor.execute("PRAGMA user_version = 0")
     conn.commit()
-    print("All new tables created successfully.")
+    print("Dropped existing tables for a fresh setup.")
+    migrate(conn)
+
+def hot_queries():
+    """
+    Hot queries the app issues, checked with EXPLAIN QUERY PLAN so an index
+    regression shows up as a failure instead of a slow dashboard. Imported
+    from the modules that run them so the check sees the real SQL
+    (ml_predictor is imported here because it imports this module).
+    """
+    from ml_predictor import COMPLETED_SINCE_QUERY
+    return {
+        "dashboard data": DASHBOARD_QUERY,
+        "last task machine (create)": LAST_TASK_MACHINE_QUERY,
+        "last created task machine": LAST_CREATED_MACHINE_QUERY,
+        "operator profiles": PROFILE_QUERY,
+        "calendar month range": MONTH_TASKS_QUERY,
+        "latest machine status": LATEST_STATUS_QUERY,
+        "machine status since": LOGS_SINCE_QUERY,
+        "tasks completed since watermark": COMPLETED_SINCE_QUERY,
+        "prediction accuracy window": ACCURACY_QUERY,
+    }
+
+# Tables that must never be read with a full scan on a hot path.
+LARGE_TABLES = {"tasks", "machine_logs"}
+
+def check_query_plans(conn):
+    """Returns a list of (query name, plan detail) for every hot query that full-scans a large table."""
+    failures = []
+    for name, sql in hot_queries().items():
+        aliases = {}
+        for table, alias in re.findall(r"(?:FROM|JOIN)\s+(\w+)(?:\s+(?!ON|WHERE|ORDER|JOIN)(\w+))?", sql):
+            aliases[alias or table] = table
+        params = (None,) * sql.count("?")
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if match and aliases.get(match.group(1), match.group(1)) in LARGE_TABLES and "INDEX" not in detail:
+                failures.append((name, detail))
+    return failures
 
 def seed_data(conn):
     """Seed the database with comprehensive sample data in the correct order."""
@@ -239,13 +603,35 @@ def seed_data(conn):
     """, tasks_today)
     print(f"Seeded {len(tasks_today)} tasks for today's dashboard across multiple users.")
 
+    # 7. A supervisor account for admin operations; added last so it gets no tasks.
+    cursor.execute("INSERT INTO users (id, operator_id_str, name, experience_level, password, role) VALUES (?, 'SUP001', 'Site Supervisor', 'Senior', 'pass', 'admin')",
+                   (str(uuid.uuid4()),))
+
     conn.commit()
     print("Database seeded successfully.")
 
 if __name__ == '__main__':
     conn = create_connection()
     if conn:
-        create_tables(conn)
-        seed_data(conn)
+        if '--check-plans' in sys.argv:
+            failures = check_query_plans(conn)
+            for name, detail in failures:
+                print(f"FULL SCAN in '{name}': {detail}")
+            conn.close()
+            sys.exit(1 if failures else 0)
+        if '--grant-admin' in sys.argv:
+            migrate(conn)
+            operator_id_str = sys.argv[sys.argv.index('--grant-admin') + 1]
+            updated = conn.execute("UPDATE users SET role = 'admin' WHERE operator_id_str = ?", (operator_id_str,)).rowcount
+            conn.commit()
+            conn.close()
+            print(f"{operator_id_str} is now an admin." if updated else f"No user {operator_id_str}.")
+            sys.exit(0 if updated else 1)
+        if '--reset' in sys.argv:
+            reset_database(conn)
+        else:
+            migrate(conn)
+        if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+            seed_data(conn)
         conn.close()
         print("Database setup complete.")
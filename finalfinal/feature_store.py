@@ -0,0 +1,195 @@
+# feature_store.py
+"""
+Per-operator and per-machine history features for the duration model, derived
+from the running sums in the feature_store table (kept current by triggers on
+tasks, see db.py migration 6). Training and prediction both go through
+derive(), so the model sees identical feature definitions on both sides.
+"""
+import threading
+import time
+
+import numpy as np
+
+from db_pool import open_connection
+
+# --- CONFIGURATION ---
+CHECK_INTERVAL_SEC = 0.25
+MIN_HISTORY = 5             # fewer completed tasks than this: use the fleet-wide value
+ENTITIES = ('operator', 'machine')
+STATS = ('duration_per_volume', 'idling_ratio', 'alert_rate')
+STORE_FEATURES = [f"{entity}_{stat}" for entity in ENTITIES for stat in STATS]
+
+# Context used when a user (or their last machine) is unknown.
+DEFAULT_CONTEXT = {
+    'operator_experience_level': 'Mid',
+    'operator_id_str': 'OP-UNKNOWN',
+    'machine_id_str': 'EXC-UNKNOWN',
+}
+
+PROFILE_QUERY = """
+    SELECT u.id, u.experience_level, u.operator_id_str,
+        (SELECT m.machine_id_str FROM tasks t JOIN machines m ON t.assigned_to_machine_id = m.id
+         WHERE t.assigned_to_user_id = u.id ORDER BY t.day DESC LIMIT 1) AS machine_id_str
+    FROM users u
+"""
+
+
+def derive(count, volume, duration, idling, alerts, prior):
+    """
+    (duration per unit volume, idling share of duration, alerts per task) from
+    sums. Works on scalars or arrays; entries with too little history take
+    the `prior` triple.
+    """
+    count, volume, duration = np.asarray(count, float), np.asarray(volume, float), np.asarray(duration, float)
+    enough = (count >= MIN_HISTORY) & (volume > 0) & (duration > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = (duration / volume, np.asarray(idling, float) / duration, np.asarray(alerts, float) / count)
+    return tuple(np.where(enough, ratio, p) for ratio, p in zip(ratios, prior))
+
+
+def load_sums(conn):
+    """{entity: {key: (count, volume, duration, idling, alerts)}} from the feature_store table."""
+    sums = {entity: {} for entity in ENTITIES}
+    for entity, key, *values in conn.execute(
+            "SELECT entity, key, task_count, volume_sum, duration_sum, idling_sum, alert_sum FROM feature_store"):
+        sums[entity][key] = tuple(values)
+    return sums
+
+
+def fleet_prior(sums):
+    """Fleet-wide feature values (every completed task counts once per entity type)."""
+    totals = np.array(list(sums['operator'].values()) or [(0, 0, 0, 0, 0)], dtype=float).sum(axis=0)
+    prior = derive(*totals, prior=(0.0, 0.0, 0.0))
+    return tuple(float(p) for p in prior)
+
+
+def task_contributions(df):
+    """(count, volume, duration, idling, alerts) each TRAINING_QUERY row adds to its operator's and machine's sums."""
+    return np.column_stack([
+        np.ones(len(df)), df['task_volume'], df['actual_duration_minutes'],
+        df['idling_time_min'].fillna(0), df['safety_alerts_triggered'].fillna(0),
+    ]).astype(float)
+
+
+def remove_tasks(sums, df):
+    """The sums as they would be without the tasks in df (e.g. a test split or holdout)."""
+    own = task_contributions(df)
+    result = {entity: dict(sums[entity]) for entity in ENTITIES}
+    for entity, key_column in (('operator', 'operator_id_str'), ('machine', 'machine_id_str')):
+        for key, values in zip(df[key_column], own):
+            result[entity][key] = tuple(np.asarray(result[entity].get(key, (0, 0, 0, 0, 0)), float) - values)
+    return result
+
+
+def add_serving_features(df, sums):
+    """Adds STORE_FEATURES from sums as they are, as FeatureStore serves them; df's own tasks must not be counted."""
+    prior = fleet_prior(sums)
+    df = df.copy()
+    for entity, key_column in (('operator', 'operator_id_str'), ('machine', 'machine_id_str')):
+        totals = np.array([sums[entity].get(key, (0, 0, 0, 0, 0)) for key in df[key_column]], dtype=float).reshape(-1, 5)
+        for stat, values in zip(STATS, derive(*totals.T, prior=prior)):
+            df[f"{entity}_{stat}"] = values
+    return df
+
+
+def add_training_features(df, sums):
+    """
+    Adds STORE_FEATURES to TRAINING_QUERY rows point-in-time: each task sees
+    only the tasks completed before it, just as a task being scheduled sees the
+    history so far. A task's own duration never enters its features.
+
+    sums must count every task in df, and df must hold every counted task
+    completed from df's earliest one on (all tasks, or those after a watermark):
+    the state before a task is then sums minus it and everything after it.
+    """
+    own = task_contributions(df)
+    order = np.lexsort((df['task_id'].astype(str).to_numpy(), df['completed_at'].fillna('').astype(str).to_numpy()))
+    ranks = np.empty(len(df), dtype=int)
+    ranks[order] = np.arange(len(df))
+    # Contributions of each task and of everything completed after it, newest first.
+    fleet_after = np.cumsum(own[order][::-1], axis=0)[::-1][ranks]
+    totals = np.array(list(sums['operator'].values()) or [(0, 0, 0, 0, 0)], dtype=float).sum(axis=0)
+    prior = derive(*(totals - fleet_after).T, prior=(0.0, 0.0, 0.0))
+    df = df.copy()
+    for entity, key_column in (('operator', 'operator_id_str'), ('machine', 'machine_id_str')):
+        keys = df[key_column].to_numpy()
+        after = np.zeros_like(own)
+        for key in set(keys):
+            rows = order[keys[order] == key]
+            after[rows] = np.cumsum(own[rows][::-1], axis=0)[::-1]
+        totals = np.array([sums[entity].get(key, (0, 0, 0, 0, 0)) for key in keys], dtype=float).reshape(-1, 5)
+        for stat, values in zip(STATS, derive(*(totals - after).T, prior=prior)):
+            df[f"{entity}_{stat}"] = values
+    return df
+
+
+class FeatureStore:
+    """
+    In-memory prediction context per user: experience level, operator id, last
+    machine, and the STORE_FEATURES for that operator and machine, so
+    /api/predict/time needs no database query. Like ReferenceCache it looks at
+    PRAGMA data_version, and when another connection has committed reads the
+    'feature_store' row of reference_versions (db.py migration 11); it reloads
+    only when that version moved.
+    """
+
+    def __init__(self, db_name, check_interval=CHECK_INTERVAL_SEC):
+        self.db_name = db_name
+        self.check_interval = check_interval
+        self._conn = None
+        self._contexts = {}
+        self._features = {entity: {} for entity in ENTITIES}
+        self._prior = (0.0, 0.0, 0.0)
+        self._data_version = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def context(self, user_id):
+        """Model inputs that come from the user rather than the task spec."""
+        self._refresh_if_changed()
+        context = self._contexts.get(user_id, DEFAULT_CONTEXT)
+        return dict(context, **self.features(context['operator_id_str'], context['machine_id_str']))
+
+    def features(self, operator_id_str, machine_id_str):
+        self._refresh_if_changed()
+        values = {}
+        for entity, key in (('operator', operator_id_str), ('machine', machine_id_str)):
+            for stat, value in zip(STATS, self._features[entity].get(key, self._prior)):
+                values[f"{entity}_{stat}"] = value
+        return values
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            if self._conn is None:
+                self._conn = open_connection(self.db_name)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                version = self._conn.execute(
+                    "SELECT version FROM reference_versions WHERE table_name = 'feature_store'").fetchone()
+                if version is None or version[0] != self._version:
+                    self._reload()
+                    self._version = version and version[0]
+                self._data_version = data_version
+            self._checked_at = time.monotonic()
+
+    def _reload(self):
+        sums = load_sums(self._conn)
+        prior = fleet_prior(sums)
+        features = {}
+        for entity in ENTITIES:
+            features[entity] = {key: tuple(float(v) for v in derive(*values, prior=prior))
+                                for key, values in sums[entity].items()}
+        contexts = {}
+        for row in self._conn.execute(PROFILE_QUERY):
+            contexts[row['id']] = {
+                'operator_experience_level': row['experience_level'] or DEFAULT_CONTEXT['operator_experience_level'],
+                'operator_id_str': row['operator_id_str'],
+                'machine_id_str': row['machine_id_str'] or DEFAULT_CONTEXT['machine_id_str'],
+            }
+        self._features, self._prior, self._contexts = features, prior, contexts
@@ -1,98 +1,213 @@
 # ml_predictor.py
+import argparse
+import hashlib
+import json
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 import joblib
+import shutil
 import sqlite3
 import os
 
+from compiled_model import compile_pipeline, compiled_path, save_compiled
+from db import migrate
+from feature_store import STORE_FEATURES, add_serving_features, add_training_features, load_sums, remove_tasks
+
 DB_NAME = "operator_assistant.db"
 MODEL_PATH = "task_time_predictor.joblib"
+PREVIOUS_SUFFIX = ".previous"   # save_model keeps the model it replaces here, for restore_previous_model
+ROLLBACK_SUFFIX = ".rollback"   # SHA-1 of a model file put back by restore_previous_model
 
-def get_training_data():
-    """Fetches and processes historical data from the database for model training."""
-    if not os.path.exists(DB_NAME):
-        print(f"Database '{DB_NAME}' not found. Please run 'db.py' first to create and seed it.")
-        return None
-        
-    conn = sqlite3.connect(DB_NAME)
-    # This query joins all necessary tables to get features for the model
-    query = """
-        SELECT
-            t.task_volume,
-            t.weather_factor,
-            t.material_density_factor,
-            t.safety_alerts_triggered,
-            t.idling_time_min,
-            pt.name as task_type,
-            u.experience_level as operator_experience_level,
-            m.machine_id_str,
-            u.operator_id_str,
-            STRFTIME('%w', t.started_at) as day_of_week,
-            STRFTIME('%H', t.started_at) as hour_of_day,
-            t.actual_duration_minutes
-        FROM tasks t
-        JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
-        JOIN users u ON t.assigned_to_user_id = u.id
-        JOIN machines m ON t.assigned_to_machine_id = m.id
-        WHERE t.status = 'Completed' AND t.actual_duration_minutes IS NOT NULL
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+# STORE_FEATURES are the per-operator/per-machine history features (feature_store.py).
+NUMERICAL_FEATURES = [
+    'task_volume', 'weather_factor', 'material_density_factor',
+    'safety_alerts_triggered', 'idling_time_min', 'hour_of_day'
+] + STORE_FEATURES
+CATEGORICAL_FEATURES = [
+    'task_type', 'operator_experience_level', 'machine_id_str',
+    'operator_id_str', 'day_of_week'
+]
+FEATURE_COLUMNS = NUMERICAL_FEATURES + CATEGORICAL_FEATURES
+TARGET = 'actual_duration_minutes'
 
-    if df.empty:
-        return df
+# Incremental training (train_incremental): new completed tasks are appended to
+# a Parquet feature cache, and the forest grows by a few trees per run.
+TRAINING_CACHE_DIR = "training_cache"
+CHUNK_ROWS = 10000          # rows per streamed read and per cache part file
+TREES_PER_INCREMENT = 20
+MAX_TREES = 300             # past this, refit from the cache instead of adding trees
+MIN_NEW_ROWS = 25           # fewer new tasks than this aren't worth a new model
+# The most recently completed tasks are held out of every training path;
+# ModelRegistry vets a new model file on them before it goes live.
+HOLDOUT_SIZE = 100
+
+# Features and target for every completed task; callers may append ORDER BY / LIMIT.
+TRAINING_QUERY = """
+    SELECT
+        t.task_volume,
+        t.weather_factor,
+        t.material_density_factor,
+        t.safety_alerts_triggered,
+        t.idling_time_min,
+        pt.name as task_type,
+        u.experience_level as operator_experience_level,
+        m.machine_id_str,
+        u.operator_id_str,
+        STRFTIME('%w', t.started_at) as day_of_week,
+        STRFTIME('%H', t.started_at) as hour_of_day,
+        t.actual_duration_minutes,
+        t.id as task_id,
+        t.completed_at
+    FROM tasks t
+    JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
+    JOIN users u ON t.assigned_to_user_id = u.id
+    JOIN machines m ON t.assigned_to_machine_id = m.id
+    WHERE t.status = 'Completed' AND t.actual_duration_minutes IS NOT NULL
+"""
+# Rows between a (completed_at, task_id) watermark and the holdout, oldest first: what incremental training reads.
+COMPLETED_SINCE_QUERY = TRAINING_QUERY + " AND (t.completed_at, t.id) > (?, ?) AND (t.completed_at, t.id) < (?, ?) ORDER BY t.completed_at, t.id"
+HOLDOUT_QUERY = TRAINING_QUERY + " ORDER BY t.completed_at DESC, t.id DESC LIMIT ?"
 
-    # Convert types for modeling
+def prepare_training_frame(df):
+    """Converts types of a TRAINING_QUERY result for modeling."""
     df['day_of_week'] = df['day_of_week'].astype(int)
     df['hour_of_day'] = df['hour_of_day'].astype(int)
-
-    print(f"Loaded {len(df)} completed tasks for training.")
-    print("Data types for training:\n", df.dtypes)
     return df
 
-def train_model():
-    """Trains the Random Forest Regressor model and saves it to a file."""
-    df = get_training_data()
+def read_holdout(conn):
+    """The HOLDOUT_SIZE most recently completed tasks (TRAINING_QUERY rows), newest first."""
+    cursor = conn.execute(HOLDOUT_QUERY, (HOLDOUT_SIZE,))
+    columns = [c[0] for c in cursor.description]
+    df = pd.DataFrame([tuple(row) for row in cursor.fetchall()], columns=columns)
+    return prepare_training_frame(df) if not df.empty else df
 
-    if df is None or len(df) < 50:
-        print("Not enough historical data to train model. Skipping.")
-        return
+def model_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def save_model(model_pipeline, path=MODEL_PATH, rollback=False):
+    """
+    Writes the model atomically, so a running app never loads a half-written file.
+    The compiled sidecar goes first, so it is in place when the app sees the new model.
+    The file being replaced is kept as path + PREVIOUS_SUFFIX. rollback=True marks
+    the new file as a rollback, which ModelRegistry accepts without comparing
+    its holdout MAE to the live model's.
+    """
+    compiled = compile_pipeline(model_pipeline)
+    if compiled:
+        save_compiled(compiled, compiled_path(path))
+    tmp_path = path + ".tmp"
+    joblib.dump(model_pipeline, tmp_path)
+    if os.path.exists(path):
+        shutil.copy2(path, path + PREVIOUS_SUFFIX + ".tmp")
+        os.replace(path + PREVIOUS_SUFFIX + ".tmp", path + PREVIOUS_SUFFIX)
+    marker = path + ROLLBACK_SUFFIX
+    if rollback:
+        with open(marker + ".tmp", 'w') as f:
+            f.write(model_digest(tmp_path))
+        os.replace(marker + ".tmp", marker)
+    elif os.path.exists(marker):
+        os.remove(marker)
+    os.replace(tmp_path, path)
+
+def restore_previous_model(path=MODEL_PATH):
+    """
+    Puts the model save_model last replaced back in place (the current one
+    becomes the previous). Every app worker's ModelRegistry picks the file up
+    like any new model. Returns False when there is no previous model.
+    """
+    previous = path + PREVIOUS_SUFFIX
+    if not os.path.exists(previous):
+        return False
+    save_model(joblib.load(previous), path, rollback=True)
+    return True
+
+def get_training_data(db_name=DB_NAME):
+    """
+    Fetches historical data from the database for model training: (TRAINING_QUERY
+    rows, feature store sums), both without the holdout tasks. Store features
+    depend on the split, so they are added by split_training_data.
+    """
+    if not os.path.exists(db_name):
+        print(f"Database '{db_name}' not found. Please run 'db.py' first to create and seed it.")
+        return None
+        
+    conn = sqlite3.connect(db_name)
+    migrate(conn)
+    df = pd.read_sql_query(TRAINING_QUERY, conn)
+    holdout = read_holdout(conn)
+    sums = remove_tasks(load_sums(conn), holdout)
+    conn.close()
+
+    if df.empty:
+        return df, sums
 
-    X = df.drop('actual_duration_minutes', axis=1)
-    y = df['actual_duration_minutes']
+    df = prepare_training_frame(df)
+    df = df[~df['task_id'].isin(holdout['task_id'])]
+    print(f"Loaded {len(df)} completed tasks for training ({len(holdout)} more held out for ModelRegistry).")
+    print("Data types for training:\n", df.dtypes)
+    return df, sums
 
-    # Define which columns are numerical and which are categorical
-    numerical_features = [
-        'task_volume', 'weather_factor', 'material_density_factor',
-        'safety_alerts_triggered', 'idling_time_min', 'hour_of_day'
-    ]
-    categorical_features = [
-        'task_type', 'operator_experience_level', 'machine_id_str',
-        'operator_id_str', 'day_of_week'
-    ]
+def build_pipeline(regressor=None, dense=False):
+    """
+    The untrained preprocessing + regressor pipeline (a random forest unless
+    another regressor is given). dense=True always hands the regressor a dense
+    matrix, for estimators that reject sparse input.
+    """
+    # scikit-learn is only needed for training; importing it here keeps this module cheap for the app.
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
 
     # Create a preprocessor to handle different data types
     preprocessor = ColumnTransformer(
         transformers=[
-            ('num', StandardScaler(), numerical_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+            ('num', StandardScaler(), NUMERICAL_FEATURES),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES)
         ],
-        remainder='drop'
+        remainder='drop',
+        sparse_threshold=0 if dense else 0.3
     )
 
     # Create the full model pipeline
-    model_pipeline = Pipeline(steps=[
+    if regressor is None:
+        regressor = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+    return Pipeline(steps=[
         ('preprocessor', preprocessor),
-        ('regressor', RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1))
+        ('regressor', regressor)
     ])
 
+def split_rows(df):
+    """The fixed 80/20 train/test split of TRAINING_QUERY rows every training path evaluates on."""
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(df, test_size=0.2, random_state=42)
+
+def featurize_split(train, test, sums):
+    """
+    (X_train, X_test, y_train, y_test) with store features. Training rows get
+    them point-in-time; test rows get them from sums without the test tasks, the
+    way a task being scheduled would, so no row's own duration reaches its
+    features.
+    """
+    train_sums = remove_tasks(sums, test)
+    train = add_training_features(train, train_sums)
+    test = add_serving_features(test, train_sums)
+    return train[FEATURE_COLUMNS], test[FEATURE_COLUMNS], train[TARGET], test[TARGET]
+
+def split_training_data(df, sums):
+    """split_rows, then featurize_split."""
+    return featurize_split(*split_rows(df), sums)
+
+def fit_and_evaluate(df, sums, model_pipeline=None):
+    """Fits a pipeline (a fresh build_pipeline() by default) on 80% of df; returns (pipeline, MAE on the other 20%)."""
+    from sklearn.metrics import mean_absolute_error
+
+    if model_pipeline is None:
+        model_pipeline = build_pipeline()
+
     # Split data for training and testing
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = split_training_data(df, sums)
 
     print("--- Training the prediction model... ---")
     model_pipeline.fit(X_train, y_train)
@@ -100,13 +215,181 @@ def train_model():
 
     # Evaluate the model
     y_pred = model_pipeline.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
+    return model_pipeline, mean_absolute_error(y_test, y_pred)
+
+def train_model(db_name=DB_NAME, model_path=MODEL_PATH):
+    """Trains the Random Forest Regressor model and saves it to a file."""
+    df, sums = get_training_data(db_name) or (None, None)
+
+    if df is None or len(df) < 50:
+        print("Not enough historical data to train model. Skipping.")
+        return
+
+    model_pipeline, mae = fit_and_evaluate(df, sums)
     print(f"Model Evaluation (Mean Absolute Error): {mae:.2f} minutes")
 
     # Save the trained model
-    joblib.dump(model_pipeline, MODEL_PATH)
-    print(f"Model saved to {MODEL_PATH}")
+    save_model(model_pipeline, model_path)
+    print(f"Model saved to {model_path}")
+    return model_pipeline
+
+def load_training_state(cache_dir):
+    """The incremental training state: high-water mark and committed cache parts (None if absent)."""
+    try:
+        with open(os.path.join(cache_dir, "state.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_training_state(cache_dir, state):
+    path = os.path.join(cache_dir, "state.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def read_completed_since(conn, watermark, before, chunk_rows=CHUNK_ROWS):
+    """Yields tasks completed after the (completed_at, task_id) watermark and before `before`, oldest first, in chunks."""
+    for chunk in pd.read_sql_query(COMPLETED_SINCE_QUERY, conn, params=(*watermark, *before), chunksize=chunk_rows):
+        yield prepare_training_frame(chunk)
+
+def uses_current_features(model_pipeline):
+    """False for a model trained before the feature lists last changed (it needs a refit, not more trees)."""
+    columns = {name: list(c) for name, _, c in model_pipeline.named_steps['preprocessor'].transformers_}
+    return columns.get('num') == NUMERICAL_FEATURES and columns.get('cat') == CATEGORICAL_FEATURES
+
+def has_unseen_categories(model_pipeline, df):
+    """True if df holds category values the fitted encoder would ignore (new operators, machines...)."""
+    encoder = model_pipeline.named_steps['preprocessor'].named_transformers_['cat']
+    return any(not set(df[column].unique()) <= set(categories.tolist())
+               for column, categories in zip(CATEGORICAL_FEATURES, encoder.categories_))
+
+def settings_template(model_pipeline):
+    """
+    An unfitted pipeline with model_pipeline's kind and settings, or None (use a
+    fresh build_pipeline()) when it was pickled by a scikit-learn version whose
+    estimators this one cannot clone.
+    """
+    from sklearn.base import clone
+
+    try:
+        return clone(model_pipeline)
+    except AttributeError:
+        pass
+    try:
+        # Only the Pipeline's own parameters may be missing; keep the regressor's.
+        dense = model_pipeline.named_steps['preprocessor'].sparse_threshold == 0
+        return build_pipeline(clone(model_pipeline.named_steps['regressor']), dense=dense)
+    except AttributeError as e:
+        print(f"Cannot reuse the current model's settings ({e}); refitting the default model.")
+        return None
+
+def train_incremental(db_name=DB_NAME, model_path=MODEL_PATH, cache_dir=TRAINING_CACHE_DIR):
+    """
+    Updates the model with tasks completed since the last run. Only new rows are
+    read from SQLite, streamed in chunks and appended to the Parquet feature
+    cache. The forest then gets TREES_PER_INCREMENT extra trees fitted on the new
+    rows (warm start). It is instead refit from the cache, with no SQL join, on
+    the first run, when new rows bring unseen categories, or past MAX_TREES.
+
+    The watermark follows completed_at, so a task only counts as new once it has
+    both completed_at and actual_duration_minutes set. The holdout tasks are
+    not read until newer tasks push them out of it.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error
+
+    if not os.path.exists(db_name):
+        print(f"Database '{db_name}' not found. Please run 'db.py' first to create and seed it.")
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    state = load_training_state(cache_dir) or {"watermark": ["", ""], "parts": [], "rows": 0}
+    # Part files a crashed run wrote but never committed to the state are discarded.
+    for name in os.listdir(cache_dir):
+        if name.endswith('.parquet') and name not in state["parts"]:
+            os.remove(os.path.join(cache_dir, name))
+
+    conn = sqlite3.connect(db_name)
+    migrate(conn)
+    holdout = read_holdout(conn)
+    # With no holdout there are no completed tasks, so the watermark itself bounds an empty read.
+    before = [holdout['completed_at'].iloc[-1], holdout['task_id'].iloc[-1]] if len(holdout) else state["watermark"]
+    new_parts, new_frames = [], []
+    for chunk in read_completed_since(conn, state["watermark"], before):
+        name = f"part-{len(state['parts']) + len(new_parts):06d}.parquet"
+        chunk.to_parquet(os.path.join(cache_dir, name), index=False)
+        new_parts.append(name)
+        new_frames.append(chunk)
+    # The cache holds raw rows; store features are added at fit time from the current sums.
+    sums = remove_tasks(load_sums(conn), holdout)
+    conn.close()
+    new_rows = sum(len(f) for f in new_frames)
+
+    model_pipeline = joblib.load(model_path) if os.path.exists(model_path) else None
+    if model_pipeline is None or state.get("model_mtime_ns") != os.stat(model_path).st_mtime_ns:
+        # The model file was replaced (e.g. by train_model), so none of its trees were added here.
+        state["added_trees"] = 0
+    if model_pipeline is not None and state["parts"] and new_rows < MIN_NEW_ROWS:
+        for name in new_parts:
+            os.remove(os.path.join(cache_dir, name))
+        print(f"{new_rows} newly completed tasks; the model is up to date.")
+        return None
+    if state["rows"] + new_rows < 50:
+        for name in new_parts:
+            os.remove(os.path.join(cache_dir, name))
+        print("Not enough historical data to train model. Skipping.")
+        return None
+
+    new_df = pd.concat(new_frames, ignore_index=True) if new_frames else None
+    regressor = model_pipeline.named_steps['regressor'] if model_pipeline is not None else None
+    if (state["parts"] and isinstance(regressor, RandomForestRegressor)
+            and uses_current_features(model_pipeline)
+            and regressor.n_estimators + TREES_PER_INCREMENT <= MAX_TREES
+            and not has_unseen_categories(model_pipeline, new_df)):
+        # Score the current model on data it has never seen before growing it,
+        # with the features these tasks had before any of them completed.
+        scored = add_serving_features(new_df, remove_tasks(sums, new_df))
+        mae = mean_absolute_error(scored[TARGET], model_pipeline.predict(scored[FEATURE_COLUMNS]))
+        print(f"--- Adding {TREES_PER_INCREMENT} trees for {new_rows} new tasks... ---")
+        fitted = add_training_features(new_df, sums)
+        X_new = model_pipeline.named_steps['preprocessor'].transform(fitted[FEATURE_COLUMNS])
+        regressor.set_params(warm_start=True, n_estimators=regressor.n_estimators + TREES_PER_INCREMENT)
+        regressor.fit(X_new, fitted[TARGET])
+        regressor.set_params(warm_start=False)
+        state["added_trees"] += TREES_PER_INCREMENT
+        print(f"Model Evaluation on the new tasks before the update (Mean Absolute Error): {mae:.2f} minutes")
+    else:
+        df = pd.read_parquet([os.path.join(cache_dir, name) for name in state["parts"] + new_parts])
+        # A cache written before the holdout existed may hold some of its tasks.
+        df = df[~df['task_id'].isin(holdout['task_id'])]
+        print(f"--- Refitting on {len(df)} cached tasks ({new_rows} new)... ---")
+        template = None
+        if model_pipeline is not None:
+            # Keep the current model's kind and settings (e.g. a model_search winner), minus warm-started trees.
+            template = settings_template(model_pipeline)
+            if template is not None and isinstance(regressor, RandomForestRegressor):
+                template.set_params(regressor__n_estimators=regressor.n_estimators - state["added_trees"])
+        model_pipeline, mae = fit_and_evaluate(df, sums, template)
+        state["added_trees"] = 0
+        print(f"Model Evaluation (Mean Absolute Error): {mae:.2f} minutes")
+
+    save_model(model_pipeline, model_path)
+    if new_df is not None:
+        last = new_df.iloc[-1]
+        state["watermark"] = [last['completed_at'], last['task_id']]
+    state["parts"] += new_parts
+    state["rows"] += new_rows
+    state["trees"] = getattr(model_pipeline.named_steps['regressor'], 'n_estimators', None)
+    state["model_mtime_ns"] = os.stat(model_path).st_mtime_ns
+    save_training_state(cache_dir, state)
+    print(f"Model saved to {model_path} ({state['rows']} tasks seen, {state['trees'] or 'no'} trees)")
     return model_pipeline
 
 if __name__ == '__main__':
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the task duration model.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only read tasks completed since the last incremental run")
+    args = parser.parse_args()
+    if args.incremental:
+        train_incremental()
+    else:
+        train_model()
@@ -0,0 +1,228 @@
+# model_registry.py
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# joblib, pandas and scikit-learn are imported where the model is loaded, on
+# the watcher thread, so importing the app doesn't pay for the ML stack.
+
+# --- CONFIGURATION ---
+POLL_INTERVAL_SEC = 5.0
+LOAD_TIMEOUT_SEC = 60.0     # how long a prediction request waits for the first load
+MAX_MAE_RATIO = 1.5         # reject a model whose holdout MAE is this much worse than the live one
+
+# One loaded model version. Handlers read registry.current once and use that
+# snapshot, so a swap never mixes two versions within a request. In shared mode
+# pipeline is None and compiled is memory-mapped.
+LoadedModel = namedtuple('LoadedModel', 'pipeline compiled version loaded_at holdout_mae')
+
+
+def predict_frame(loaded, df):
+    """Predictions for a feature frame with whichever form of the model is loaded."""
+    if loaded.pipeline is not None:
+        return loaded.pipeline.predict(df)
+    return loaded.compiled.predict(df.to_dict('records'))
+
+
+class ModelRegistry:
+    """
+    Owns the live prediction model of one worker. A background thread watches
+    the model file; when it changes (ml_predictor.save_model replaces it
+    atomically) the new file is loaded, checked on the most recently completed
+    tasks (ml_predictor.read_holdout, which no training path fits on), and
+    swapped in with a single reference assignment.
+    rollback() restores the previous model file, so every worker swaps back.
+
+    With shared=True only the compiled sidecar is loaded, memory-mapped, so
+    all worker processes share one physical copy of the forest.
+    """
+
+    def __init__(self, path, pool, poll_interval=POLL_INTERVAL_SEC, shared=False):
+        self.path = path
+        self.pool = pool
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.on_swap = []           # callables(LoadedModel) run after every swap
+        self.last_error = None
+        self._current = None
+        self._previous = None
+        self._seen = None           # file signature last loaded or rejected
+        self._lock = threading.Lock()
+        self._ready = threading.Event()   # set once the first load has been attempted
+        self._thread = None
+
+    @property
+    def current(self):
+        """The live LoadedModel (waiting for the first load if needed), or None when there is no model."""
+        self.warm()
+        self._ready.wait(LOAD_TIMEOUT_SEC)
+        return self._current
+
+    def warm(self):
+        """Starts the watcher thread, which loads the model first, without waiting for it."""
+        if self._thread is None or not self._thread.is_alive():
+            # Started on first use so each forked worker gets its own watcher.
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+                    self._thread.start()
+
+    def load(self):
+        """Loads the model file now without holdout checks (startup). Returns the LoadedModel or None."""
+        try:
+            signature = self._signature()
+            if signature is None:
+                print(f"Model file not found at {self.path}. Prediction endpoint will not work. Run 'python ml_predictor.py' to train it.")
+                return None
+            try:
+                loaded = self._load_file(signature)
+            except Exception as e:
+                self.last_error = f"Error loading model: {e}"
+                print(self.last_error)
+                return None
+            self._seen = signature
+            self._swap(loaded)
+            print("Prediction model loaded successfully.")
+            return loaded
+        finally:
+            self._ready.set()
+
+    def check(self):
+        """Loads, validates and swaps in the model file if it changed since the last look."""
+        signature = self._signature()
+        if signature is None or signature == self._seen:
+            return False
+        self._seen = signature
+        try:
+            candidate = self._load_file(signature)
+            candidate = candidate._replace(holdout_mae=self._validate(candidate, compare_live=not self._is_rollback()))
+        except Exception as e:
+            self.last_error = f"Rejected model version {signature[0]}: {e}"
+            print(self.last_error)
+            return False
+        self._swap(candidate)
+        print(f"Prediction model version {candidate.version} is live (holdout MAE {candidate.holdout_mae}).")
+        return True
+
+    def rollback(self):
+        """
+        Restores the model file that the current one replaced (ml_predictor keeps
+        it). This worker swaps it in right away; every other worker and process
+        watching the file does within poll_interval. Returns False when there is
+        no previous model file or the restored one fails its checks; last_error
+        says which.
+        """
+        from ml_predictor import restore_previous_model
+
+        if not restore_previous_model(self.path):
+            self.last_error = "No previous model version to roll back to"
+            return False
+        self.check()
+        # The watcher thread may have run check() first; either way the restored file must be live.
+        live, signature = self._current, self._signature()
+        return live is not None and signature is not None and live.version == signature[0]
+
+    def _is_rollback(self):
+        """True when the model file is one restore_previous_model put back."""
+        from ml_predictor import ROLLBACK_SUFFIX, model_digest
+
+        try:
+            with open(self.path + ROLLBACK_SUFFIX) as f:
+                return f.read().strip() == model_digest(self.path)
+        except FileNotFoundError:
+            return False
+
+    def status(self):
+        current, previous = self._current, self._previous
+        describe = lambda m: m and {"version": m.version, "loaded_at": m.loaded_at,
+                                    "holdout_mae": m.holdout_mae, "compiled": m.compiled is not None,
+                                    "shared": m.pipeline is None}
+        return {"current": describe(current), "previous": describe(previous), "last_error": self.last_error,
+                "loading": not self._ready.is_set()}
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_file(self, signature):
+        import joblib
+        from compiled_model import compile_pipeline
+
+        loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        if self.shared:
+            return LoadedModel(None, self._load_shared(), signature[0], loaded_at, None)
+        pipeline = joblib.load(self.path)
+        return LoadedModel(pipeline, compile_pipeline(pipeline), signature[0], loaded_at, None)
+
+    def _load_shared(self):
+        import joblib
+        from compiled_model import compile_pipeline, compiled_path, save_compiled, load_shared
+
+        sidecar = compiled_path(self.path)
+        if not os.path.exists(sidecar) or os.stat(sidecar).st_mtime_ns < os.stat(self.path).st_mtime_ns:
+            # Model saved by an older ml_predictor: build the sidecar once (workers may race; the write is atomic).
+            compiled = compile_pipeline(joblib.load(self.path))
+            if compiled is None:
+                raise ValueError("shared mode needs a model that compiled_model can compile")
+            save_compiled(compiled, sidecar)
+        return load_shared(sidecar)
+
+    def _holdout(self):
+        from feature_store import add_serving_features, load_sums, remove_tasks
+        from ml_predictor import FEATURE_COLUMNS, TARGET, read_holdout
+
+        with self.pool.connection() as conn:
+            df = read_holdout(conn)
+            sums = load_sums(conn)
+        if df.empty:
+            return None
+        # Features as they were before the holdout tasks completed, so their durations aren't in them.
+        df = add_serving_features(df, remove_tasks(sums, df))
+        return df[FEATURE_COLUMNS], df[TARGET].to_numpy()
+
+    def _validate(self, candidate, compare_live=True):
+        """
+        Raises ValueError unless the candidate predicts sanely on the holdout (and,
+        if compare_live, not much worse than the live model); returns its MAE.
+        """
+        holdout = self._holdout()
+        if holdout is None:
+            return None
+        X, y = holdout
+        predictions = predict_frame(candidate, X)
+        if not np.all(np.isfinite(predictions)) or np.any(predictions < 0):
+            raise ValueError("non-finite or negative predictions on the holdout")
+        if candidate.pipeline is not None and candidate.compiled is not None:
+            if not np.allclose(candidate.compiled.predict(X.to_dict('records')), predictions, rtol=1e-9, atol=1e-9):
+                raise ValueError("compiled model disagrees with the pipeline")
+        mae = round(float(np.mean(np.abs(predictions - y))), 2)
+        live = self._current
+        if compare_live and live is not None:
+            live_mae = float(np.mean(np.abs(predict_frame(live, X) - y)))
+            if mae > live_mae * MAX_MAE_RATIO:
+                raise ValueError(f"holdout MAE {mae:.2f} vs {live_mae:.2f} for the live model")
+        return mae
+
+    def _swap(self, loaded):
+        with self._lock:
+            if self._current is not None:
+                self._previous = self._current
+            self._current = loaded
+        for hook in self.on_swap:
+            hook(loaded)
+
+    def _run(self):
+        if not self._ready.is_set():
+            self.load()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Model watcher error: {e}")
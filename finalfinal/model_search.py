@@ -0,0 +1,188 @@
+# model_search.py
+"""
+Model comparison for the task duration predictor. Every candidate regressor and
+parameter combination is cross-validated on the training split in parallel
+across CPU cores. Fit time, predict latency and MAE are recorded for each, and
+the best by CV MAE that compiled_model can compile is refit, scored on the
+held-out test split, and saved as task_time_predictor.joblib with a JSON report
+next to it.
+
+Run `python model_search.py` (add --quick for a small grid). Only compiled
+models get the fast single-prediction path, and SHARED_MODEL=1 workers refuse
+anything else, so a better-ranked model that cannot be compiled (gradient
+boosting, linear) is saved only with --allow-uncompiled.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from compiled_model import compile_pipeline
+from feature_store import remove_tasks
+from ml_predictor import (DB_NAME, MODEL_PATH, build_pipeline, featurize_split, get_training_data, save_model,
+                          split_rows, split_training_data)
+
+# --- CONFIGURATION ---
+REPORT_PATH = "model_search_report.json"
+CV_FOLDS = 5
+LATENCY_SAMPLES = 20        # single-row predictions timed per candidate
+
+
+def candidates(quick=False, only=None):
+    """(name, regressor factory, parameter grid, needs dense input) for every model family (or those in `only`)."""
+    from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+    from sklearn.linear_model import LinearRegression, Ridge
+
+    # n_jobs=1 inside each fit: the search already spreads fits across cores.
+    forest_grid = {'n_estimators': [100, 200], 'max_depth': [None, 20], 'min_samples_leaf': [1, 5]}
+    boosting_grid = {'learning_rate': [0.05, 0.1], 'max_leaf_nodes': [15, 31], 'max_iter': [200, 400]}
+    if quick:
+        forest_grid = {'n_estimators': [100], 'min_samples_leaf': [1, 5]}
+        boosting_grid = {'learning_rate': [0.1], 'max_leaf_nodes': [31]}
+    families = [
+        ('random_forest', lambda **p: RandomForestRegressor(random_state=42, n_jobs=1, **p), forest_grid, False),
+        ('hist_gradient_boosting', lambda **p: HistGradientBoostingRegressor(random_state=42, **p), boosting_grid, True),
+        ('ridge', lambda **p: Ridge(**p), {'alpha': [0.1, 1.0, 10.0]}, False),
+        ('linear', lambda **p: LinearRegression(**p), {}, False),
+    ]
+    return [family for family in families if not only or family[0] in only]
+
+
+def make_pipeline(name, params, quick=False):
+    for candidate, factory, _, dense in candidates(quick):
+        if candidate == name:
+            return build_pipeline(factory(**params), dense=dense)
+    raise ValueError(f"unknown candidate {name}")
+
+
+def single_row_latency(pipeline, X):
+    """Median seconds for one-row predictions, the shape /api/predict/time makes."""
+    timings = []
+    for i in range(min(LATENCY_SAMPLES, len(X))):
+        row = X.iloc[i:i + 1]
+        start = time.perf_counter()
+        pipeline.predict(row)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def evaluate_fold(name, params, quick, X_train, X_test, y_train, y_test, time_single_rows):
+    """Fits one candidate on one CV fold; returns its MAE and timings."""
+    pipeline = make_pipeline(name, params, quick)
+    start = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    fit_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = pipeline.predict(X_test)
+    predict_sec = time.perf_counter() - start
+    return {
+        'mae': float(np.mean(np.abs(predictions - y_test.to_numpy()))),
+        'fit_sec': fit_sec,
+        'batch_predict_us_per_row': predict_sec / len(X_test) * 1e6,
+        'single_predict_ms': single_row_latency(pipeline, X_test) * 1000 if time_single_rows else None,
+    }
+
+
+def search(df, sums, folds=CV_FOLDS, n_jobs=-1, quick=False, only=None):
+    """
+    Cross-validates every candidate in parallel on the training split; returns
+    result dicts sorted by mean MAE. Each fold gets its own store features, like
+    the test split: its validation tasks are removed from the sums, so
+    candidates are ranked the way they will predict when serving.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import KFold, ParameterGrid
+
+    train, test = split_rows(df)
+    train_sums = remove_tasks(sums, test)
+    splits = [featurize_split(train.iloc[fit], train.iloc[validate], train_sums)
+              for fit, validate in KFold(n_splits=folds, shuffle=True, random_state=42).split(train)]
+    grid = [(name, params) for name, _, param_grid, _ in candidates(quick, only) for params in ParameterGrid(param_grid)]
+    tasks = [(name, params, fold) for name, params in grid for fold in range(folds)]
+    print(f"--- Cross-validating {len(grid)} candidates x {folds} folds = {len(tasks)} fits ---")
+
+    outcomes = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_fold)(name, params, quick, *splits[fold], fold == 0)
+        for name, params, fold in tasks
+    )
+    results = []
+    for i, (name, params) in enumerate(grid):
+        runs = outcomes[i * folds:(i + 1) * folds]
+        maes = [r['mae'] for r in runs]
+        results.append({
+            'model': name,
+            'params': params,
+            'cv_mae': float(np.mean(maes)),
+            'cv_mae_std': float(np.std(maes)),
+            'fit_sec': float(np.mean([r['fit_sec'] for r in runs])),
+            'batch_predict_us_per_row': float(np.mean([r['batch_predict_us_per_row'] for r in runs])),
+            'single_predict_ms': runs[0]['single_predict_ms'],
+        })
+    return sorted(results, key=lambda r: r['cv_mae'])
+
+
+def run_search(db_name=DB_NAME, model_path=MODEL_PATH, report_path=REPORT_PATH, folds=CV_FOLDS, n_jobs=-1,
+               quick=False, only=None, allow_uncompiled=False):
+    """
+    Searches, refits the winner on the training split, saves it and writes the
+    report. The winner is the best candidate compiled_model can compile, or the
+    best overall with allow_uncompiled.
+    """
+    df, sums = get_training_data(db_name) or (None, None)
+    if df is None or len(df) < 50:
+        print("Not enough historical data to train model. Skipping.")
+        return None
+
+    started = time.perf_counter()
+    results = search(df, sums, folds, n_jobs, quick, only)
+    for r in results:
+        print(f"{r['model']:>24} {json.dumps(r['params']):<60} MAE {r['cv_mae']:7.2f} ± {r['cv_mae_std']:5.2f}  "
+              f"fit {r['fit_sec']:6.2f} s  single {r['single_predict_ms']:6.2f} ms  "
+              f"batch {r['batch_predict_us_per_row']:7.1f} us/row")
+
+    X_train, X_test, y_train, y_test = split_training_data(df, sums)
+    for best in results:
+        model_pipeline = make_pipeline(best['model'], best['params'], quick)
+        if best['model'] == 'random_forest':
+            # Serve with all cores, as train_model's forest does.
+            model_pipeline.set_params(regressor__n_jobs=-1)
+        model_pipeline.fit(X_train, y_train)
+        if allow_uncompiled or compile_pipeline(model_pipeline) is not None:
+            break
+        print(f"Not saving {best['model']} {best['params']}: it cannot be compiled (--allow-uncompiled saves it anyway).")
+    else:
+        print("No candidate can be compiled; the model file is unchanged.")
+        return None
+    test_mae = float(np.mean(np.abs(model_pipeline.predict(X_test) - y_test.to_numpy())))
+    save_model(model_pipeline, model_path)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'training_rows': len(X_train),
+        'test_rows': len(X_test),
+        'folds': folds,
+        'allow_uncompiled': allow_uncompiled,
+        'search_sec': time.perf_counter() - started,
+        'winner': dict(best, test_mae=test_mae),
+        'candidates': results,
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Best: {best['model']} {best['params']} (CV MAE {best['cv_mae']:.2f}, test MAE {test_mae:.2f} minutes)")
+    print(f"Model saved to {model_path}, report written to {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare regressors for the task duration model.")
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--jobs', type=int, default=-1, help="parallel fits (-1: all cores)")
+    parser.add_argument('--quick', action='store_true', help="small parameter grids")
+    parser.add_argument('--only', nargs='+', choices=[name for name, _, _, _ in candidates()],
+                        help="model families to try")
+    parser.add_argument('--allow-uncompiled', action='store_true',
+                        help="save the best model even if compiled_model cannot compile it (disables SHARED_MODEL)")
+    args = parser.parse_args()
+    run_search(folds=args.folds, n_jobs=args.jobs, quick=args.quick, only=args.only,
+               allow_uncompiled=args.allow_uncompiled)
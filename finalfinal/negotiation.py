@@ -0,0 +1,142 @@
+# negotiation.py
+"""
+Content negotiation for the JSON API, for clients on slow links.
+
+Representation (Accept header; anything else, including */*, gets plain JSON):
+- application/json                 the usual lists of objects
+- COMPACT_JSON                     every list of objects that share the same keys
+                                   becomes {"columns": [...], "rows": [[...], ...]},
+                                   so keys are sent once per list, not once per row
+- application/msgpack              MessagePack of the plain structure (only when the
+                                   msgpack package is installed)
+
+Compression (Accept-Encoding): br when the brotli package is installed, otherwise
+gzip, for API responses of at least MIN_COMPRESS_BYTES. A compressed response
+gets its own strong ETag (suffix -gzip / -br), and If-None-Match checks accept
+either form through matching_etag().
+
+`python benchmark.py encoding` compares payload sizes and serialization time
+per endpoint.
+"""
+import gzip
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# --- CONFIGURATION ---
+MIN_COMPRESS_BYTES = 512    # below this the compression headers cost about what they save
+GZIP_LEVEL = 1              # compressed per request: higher levels cost 2-3x the CPU for a few % smaller bodies
+BROTLI_QUALITY = 5          # brotli's slower top levels are meant for static assets
+
+JSON = 'application/json'
+COMPACT_JSON = 'application/vnd.operator-assistant.compact+json'
+MSGPACK = 'application/msgpack'
+ENCODINGS = ('br', 'gzip')
+
+
+def representations():
+    """Media types this process can produce, plain JSON first so */* gets it."""
+    return [JSON, COMPACT_JSON] + ([MSGPACK] if msgpack else [])
+
+
+def encodings():
+    """Content codings this process can produce, preferred first."""
+    return [e for e in ENCODINGS if e != 'br' or brotli]
+
+
+def negotiate(accept):
+    """The media type to answer with for a request's accept_mimetypes."""
+    return accept.best_match(representations(), default=JSON)
+
+
+def to_compact(obj, sort_keys=True):
+    """Rewrites every list of objects sharing one key set as {"columns": keys, "rows": value lists}."""
+    if isinstance(obj, dict):
+        return {k: to_compact(v, sort_keys) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if obj and all(isinstance(item, dict) and item.keys() == obj[0].keys() for item in obj):
+            columns = sorted(obj[0]) if sort_keys else list(obj[0])
+            return {"columns": columns, "rows": [[to_compact(item[c], sort_keys) for c in columns] for item in obj]}
+        return [to_compact(item, sort_keys) for item in obj]
+    return obj
+
+
+def from_compact(obj):
+    """The inverse of to_compact, for clients and checks."""
+    if isinstance(obj, dict):
+        if obj.keys() == {"columns", "rows"}:
+            return [{c: from_compact(v) for c, v in zip(obj["columns"], row)} for row in obj["rows"]]
+        return {k: from_compact(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [from_compact(item) for item in obj]
+    return obj
+
+
+def _msgpack_default(o):
+    if hasattr(o, 'item'):      # numpy scalars
+        return o.item()
+    return str(o)               # dates, decimals, uuids: as JSON would show them
+
+
+def serialize(obj, mimetype, dumps):
+    """The body for obj in one of representations(); dumps is the app's JSON dumps."""
+    if mimetype == MSGPACK:
+        return msgpack.packb(obj, default=_msgpack_default)
+    if mimetype == COMPACT_JSON:
+        obj = to_compact(obj)
+    return f"{dumps(obj, separators=(',', ':'))}\n".encode('utf-8')
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def matching_etag(if_none_match, etag):
+    """The form of etag (plain or with an encoding suffix) listed in If-None-Match, or None."""
+    for candidate in [etag] + [f"{etag}-{e}" for e in ENCODINGS]:
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """jsonify() that answers in the representation the request's Accept header asks for."""
+
+    def response(self, *args, **kwargs):
+        mimetype = negotiate(request.accept_mimetypes) if has_request_context() else JSON
+        if mimetype == JSON:
+            response = super().response(*args, **kwargs)
+        else:
+            obj = self._prepare_response_obj(args, kwargs)
+            response = self._app.response_class(serialize(obj, mimetype, self.dumps), mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
+
+
+def compress_response(response):
+    """after_request hook: compresses API bodies for clients that accept it."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in (JSON, COMPACT_JSON, MSGPACK) or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(encodings())
+    body = response.get_data()
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
@@ -0,0 +1,101 @@
+# prediction_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+MAX_ENTRIES = 10000
+TTL_SEC = 600.0
+
+
+def feature_columns(pipeline):
+    """(numeric, categorical) input columns of the ml_predictor pipeline (or its CompiledPipeline)."""
+    if hasattr(pipeline, 'numeric_columns'):
+        return list(pipeline.numeric_columns), list(pipeline.categorical_columns)
+    transformers = {name: columns for name, _, columns in pipeline.named_steps['preprocessor'].transformers_}
+    return list(transformers['num']), list(transformers['cat'])
+
+
+class PredictionCache:
+    """
+    LRU cache of predictions keyed on the resolved feature row, i.e. exactly the
+    columns the model sees (operator_id_str and machine_id_str included), so two
+    requests share an entry only when the model would give them the same answer.
+
+    Entries belong to one model version, which is part of the key: a request
+    that started before a swap can neither read nor store an entry of the other
+    version. bind() with a different version (a new task_time_predictor.joblib
+    was loaded) empties the cache. Entries also expire after ttl seconds.
+    Counters are per worker process.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SEC):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_version = None
+        self._numeric, self._categorical = [], []
+        self._entries = OrderedDict()   # key -> (expires_at, prediction)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def bind(self, pipeline, version):
+        """Points the cache at a newly loaded model, dropping entries from any other version."""
+        with self._lock:
+            if version != self.model_version:
+                self._entries.clear()
+                self.model_version = version
+            self._numeric, self._categorical = feature_columns(pipeline)
+
+    def key(self, record, version):
+        """The cache key for a feature record predicted by model `version` (LoadedModel.version)."""
+        # Numbers are compared as floats so 5, 5.0 and "5" share an entry; the
+        # encoder matches categories by value and type, so those stay as given.
+        return (
+            version,
+            tuple(float(record[c]) for c in self._numeric),
+            tuple(record[c].strip() if isinstance(record[c], str) else record[c] for c in self._categorical),
+        )
+
+    def get(self, key):
+        """Cached prediction for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, prediction):
+        with self._lock:
+            if key[0] != self.model_version:
+                return      # predicted by a model that has been swapped out since
+            self._entries[key] = (time.monotonic() + self.ttl, prediction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
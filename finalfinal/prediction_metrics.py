@@ -0,0 +1,292 @@
+# prediction_metrics.py
+"""
+Latency and accuracy instrumentation for the duration predictor.
+
+- StageHistograms: per-stage latency histograms for /api/predict/time
+  (feature store lookup, record build, cache, model, log), per worker process.
+- PredictionLogger: every prediction is written to prediction_log in batches
+  by a background thread; a task created from a prediction carries its id in
+  tasks.prediction_id (db.py migration 7).
+- AccuracyMonitor: periodically joins prediction_log with completed tasks and
+  reports MAE and bias per task type over a rolling window, against the window
+  before it, so drift shows up as the two diverging.
+
+Run `python prediction_metrics.py` for the accuracy report of the local database.
+"""
+import bisect
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# --- CONFIGURATION ---
+# Histogram bucket upper bounds in seconds: 10 us to 10 s, four per decade.
+BUCKET_BOUNDS = [1e-5 * 10 ** (i / 4) for i in range(25)]
+LOG_FLUSH_INTERVAL_SEC = 1.0
+LOG_MAX_PENDING = 100000      # predictions waiting to be written before new ones are dropped
+ACCURACY_INTERVAL_SEC = 60.0
+ACCURACY_WINDOW_DAYS = 7
+MIN_SAMPLES = 10              # fewer completed predictions than this in a window: no drift verdict
+DRIFT_MAE_RATIO = 1.25        # window MAE this much worse than the window before counts as drift
+
+LOG_COLUMNS = ['id', 'created_at', 'user_id', 'task_type', 'predicted_minutes', 'model_version', 'cached', 'source', 'latency_ms']
+INSERT_PREDICTION_SQL = f"""
+    INSERT INTO prediction_log ({', '.join(LOG_COLUMNS)})
+    VALUES ({', '.join('?' * len(LOG_COLUMNS))})
+"""
+
+ACCURACY_QUERY = """
+    SELECT p.task_type, p.predicted_minutes, t.actual_duration_minutes, t.completed_at
+    FROM tasks t
+    JOIN prediction_log p ON p.id = t.prediction_id
+    WHERE t.completed_at >= ? AND t.status = 'Completed' AND t.actual_duration_minutes IS NOT NULL
+"""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (None when empty)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else None,
+            "p50_ms": _ms(self.quantile(0.50)),
+            "p95_ms": _ms(self.quantile(0.95)),
+            "p99_ms": _ms(self.quantile(0.99)),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+class StageTimer:
+    """Splits one request into named stages: mark(name) closes the stage that started at the previous mark."""
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+class StageHistograms:
+    """A Histogram per (endpoint, stage), plus each endpoint's total."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, timer):
+        with self._lock:
+            for stage, seconds in list(timer.stages.items()) + [('total', timer.total())]:
+                histogram = self._histograms.get((endpoint, stage))
+                if histogram is None:
+                    histogram = self._histograms[(endpoint, stage)] = Histogram()
+                histogram.observe(seconds)
+
+    def snapshot(self):
+        """{endpoint: {stage: summary}}"""
+        with self._lock:
+            result = {}
+            for (endpoint, stage), histogram in sorted(self._histograms.items()):
+                result.setdefault(endpoint, {})[stage] = histogram.snapshot()
+            return result
+
+    def prometheus(self, name='prediction_stage_seconds'):
+        """The histograms in the Prometheus text exposition format."""
+        lines = [f"# HELP {name} Prediction request time by stage (this worker).", f"# TYPE {name} histogram"]
+        with self._lock:
+            for (endpoint, stage), histogram in sorted(self._histograms.items()):
+                labels = f'endpoint="{endpoint}",stage="{stage}"'
+                seen = 0
+                for bound, count in zip(histogram.bounds + [float('inf')], histogram.counts):
+                    seen += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:.6g}"
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {seen}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.9f}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class PredictionLogger:
+    """
+    Buffers prediction_log rows and writes them from a background thread with
+    executemany, one transaction per flush, so logging adds no write to the
+    request. A crash loses at most the last flush interval of log rows; when the
+    buffer is full new rows are dropped (and counted) rather than slowing
+    predictions down.
+    """
+
+    def __init__(self, pool, flush_interval=LOG_FLUSH_INTERVAL_SEC, max_pending=LOG_MAX_PENDING):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.logged = self.dropped = 0
+
+    def record(self, predictions, user_id, model_version, cached=False, source='single', latency_ms=None):
+        """Queues [(task_type, predicted_minutes), ...]; returns their prediction ids in order."""
+        created_at = datetime.now().isoformat()
+        rows = [(str(uuid.uuid4()), created_at, user_id, task_type, float(predicted), model_version,
+                 int(cached), source, latency_ms) for task_type, predicted in predictions]
+        with self._lock:
+            if len(self._pending) + len(rows) > self.max_pending:
+                self.dropped += len(rows)
+            else:
+                self._pending.extend(rows)
+            if self._thread is None or not self._thread.is_alive():
+                # Started on first use so each forked worker gets its own writer.
+                self._thread = threading.Thread(target=self._run, name='prediction-logger', daemon=True)
+                self._thread.start()
+        return [row[0] for row in rows]
+
+    def flush(self):
+        """Writes everything queued so far. Returns the number of rows written."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        with self.pool.connection() as conn:
+            conn.executemany(INSERT_PREDICTION_SQL, rows)
+            conn.commit()
+        with self._lock:
+            self.logged += len(rows)
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {"logged": self.logged, "pending": len(self._pending), "dropped": self.dropped}
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Prediction log write error: {e}")
+
+
+def _summarize(errors):
+    """MAE and mean signed error (positive: the model under-predicts) of actual - predicted values."""
+    if not errors:
+        return {"count": 0, "mae": None, "bias": None}
+    return {
+        "count": len(errors),
+        "mae": round(sum(abs(e) for e in errors) / len(errors), 2),
+        "bias": round(sum(errors) / len(errors), 2),
+    }
+
+
+def accuracy_report(conn, now=None, window_days=ACCURACY_WINDOW_DAYS):
+    """
+    Per task type: MAE and bias of logged predictions for tasks completed in the
+    last window_days and in the window before, and whether the error drifted.
+    """
+    now = now or datetime.now()
+    window_start = now - timedelta(days=window_days)
+    previous_start = window_start - timedelta(days=window_days)
+    current, previous = {}, {}
+    for row in conn.execute(ACCURACY_QUERY, (previous_start.isoformat(),)):
+        window = current if row['completed_at'] >= window_start.isoformat() else previous
+        window.setdefault(row['task_type'], []).append(row['actual_duration_minutes'] - row['predicted_minutes'])
+
+    task_types = {}
+    for task_type in sorted(set(current) | set(previous), key=str):
+        now_stats, before = _summarize(current.get(task_type, [])), _summarize(previous.get(task_type, []))
+        drifting = None
+        if now_stats['count'] >= MIN_SAMPLES and before['count'] >= MIN_SAMPLES:
+            drifting = now_stats['mae'] > before['mae'] * DRIFT_MAE_RATIO
+        task_types[task_type] = {"window": now_stats, "previous_window": before, "drifting": drifting}
+    return {
+        "computed_at": now.isoformat(timespec='seconds'),
+        "window_days": window_days,
+        "overall": _summarize([e for errors in current.values() for e in errors]),
+        "task_types": task_types,
+    }
+
+
+class AccuracyMonitor:
+    """
+    Recomputes accuracy_report every interval seconds on a background thread,
+    started on first use; report() returns the latest result without querying.
+    """
+
+    def __init__(self, pool, interval=ACCURACY_INTERVAL_SEC, window_days=ACCURACY_WINDOW_DAYS):
+        self.pool = pool
+        self.interval = interval
+        self.window_days = window_days
+        self.last_error = None
+        self._report = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def report(self, timeout=10.0):
+        """The latest accuracy report (waiting for the first computation if needed), or None."""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='accuracy-monitor', daemon=True)
+                    self._thread.start()
+        self._ready.wait(timeout)
+        return self._report
+
+    def refresh(self):
+        with self.pool.connection() as conn:
+            self._report = accuracy_report(conn, window_days=self.window_days)
+        return self._report
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"Accuracy job error: {e}"
+                print(self.last_error)
+            self._ready.set()
+            time.sleep(self.interval)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from db_pool import open_connection
+
+    parser = argparse.ArgumentParser(description="Rolling accuracy of logged duration predictions.")
+    parser.add_argument('--db', default="operator_assistant.db")
+    parser.add_argument('--window-days', type=int, default=ACCURACY_WINDOW_DAYS)
+    args = parser.parse_args()
+    print(json.dumps(accuracy_report(open_connection(args.db), window_days=args.window_days), indent=2))
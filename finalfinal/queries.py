@@ -0,0 +1,24 @@
+# queries.py
+"""
+SQL the app.py views run, kept here so db.py's check_query_plans checks the
+same text the views execute (app.py itself is too heavy for db.py to import).
+"""
+
+# report_issue: the machine of the user's most recently created task.
+LAST_CREATED_MACHINE_QUERY = (
+    "SELECT assigned_to_machine_id as id FROM tasks WHERE assigned_to_user_id = ? ORDER BY created_at DESC LIMIT 1"
+)
+
+# create_task: the machine of the user's latest task, so new tasks stay on it.
+LAST_TASK_MACHINE_QUERY = (
+    "SELECT assigned_to_machine_id FROM tasks WHERE assigned_to_user_id = ? ORDER BY day DESC, created_at DESC LIMIT 1"
+)
+
+# tasks_for_month: a user's tasks with first_day <= day < end_day.
+MONTH_TASKS_QUERY = """
+    SELECT t.id, t.day, t.status, t.task_volume, pt.name as title, pt.task_unit
+    FROM tasks t
+    JOIN predefined_tasks pt ON t.predefined_task_id = pt.id
+    WHERE t.assigned_to_user_id = ? AND t.day >= ? AND t.day < ?
+    ORDER BY t.day
+"""
@@ -0,0 +1,93 @@
+# reference_cache.py
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date
+
+from db_pool import open_connection
+
+# --- CONFIGURATION ---
+# Reference data changes rarely, so the version check can be lazier than the status cache's.
+CHECK_INTERVAL_SEC = 1.0
+MAX_KEYS_PER_TABLE = 1000   # e.g. distinct machine models asked for; beyond this responses aren't cached
+MAX_AGE_SEC = 60            # how long browsers reuse a response before revalidating it
+
+# A serialized response body, its validators and the response headers carrying
+# them. The ETag is a digest of the body, so every worker (and every restart)
+# gives the same data the same tag.
+CachedResponse = namedtuple('CachedResponse', 'body etag last_modified headers')
+
+
+class ReferenceCache:
+    """
+    Serialized responses built from near-static reference tables
+    (predefined_tasks, training_modules), kept in memory per (table, key).
+
+    Triggers bump reference_versions whenever one of those tables changes (db.py
+    migration 8). Like LatestStatusCache, the cache looks at PRAGMA data_version
+    at most every check_interval seconds and, when another connection has
+    committed, re-reads the small reference_versions table; only tables whose
+    version moved are dropped. Everything else -- including answering
+    If-None-Match with 304 -- is served from memory.
+    """
+
+    def __init__(self, db_name, check_interval=CHECK_INTERVAL_SEC):
+        self.db_name = db_name
+        self.check_interval = check_interval
+        self._conn = None
+        self._entries = {}      # table -> {key: CachedResponse}
+        self._versions = {}     # table -> (version, changed_at)
+        self._data_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, table, key, load):
+        """
+        The CachedResponse for `key` of `table`, calling load(conn) -> response on
+        this cache's connection when it is missing or the table changed. The key
+        should include anything the response depends on, such as its media type.
+        """
+        self._refresh_if_changed()
+        entry = self._entries.get(table, {}).get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            response = load(self._conn)
+            body = response.get_data()
+            changed_at = self._versions.get(table, (None, None))[1]
+            last_modified = datetime.fromisoformat(changed_at).replace(tzinfo=timezone.utc) if changed_at else None
+            etag = hashlib.sha1(body).hexdigest()
+            headers = {'Content-Type': response.content_type, 'ETag': f'"{etag}"',
+                       'Cache-Control': f'private, max-age={MAX_AGE_SEC}'}
+            if 'Vary' in response.headers:
+                headers['Vary'] = response.headers['Vary']
+            if last_modified:
+                headers['Last-Modified'] = http_date(last_modified)
+            entry = CachedResponse(body, etag, last_modified, headers)
+            entries = self._entries.setdefault(table, {})
+            if len(entries) < MAX_KEYS_PER_TABLE:
+                entries[key] = entry
+            return entry
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            if self._conn is None:
+                self._conn = open_connection(self.db_name)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                versions = {row['table_name']: (row['version'], row['changed_at'])
+                            for row in self._conn.execute("SELECT table_name, version, changed_at FROM reference_versions")}
+                for table in set(self._entries):
+                    if versions.get(table) != self._versions.get(table):
+                        del self._entries[table]
+                self._versions = versions
+                self._data_version = data_version
+            self._checked_at = time.monotonic()
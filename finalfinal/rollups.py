@@ -0,0 +1,56 @@
+# rollups.py
+from datetime import datetime
+
+# --- CONFIGURATION ---
+METRICS = ('tilt_angle', 'visibility_percent', 'hydraulic_pressure', 'engine_temp')
+# Finest first: (name, bucket length in seconds, how to cut a bucket start from an ISO timestamp).
+RESOLUTIONS = (
+    ('minute', 60, lambda ts: ts[:16] + ':00'),
+    ('hour', 3600, lambda ts: ts[:13] + ':00:00'),
+    ('day', 86400, lambda ts: ts[:10] + 'T00:00:00'),
+)
+RESOLUTIONS_BY_NAME = {name: cut for name, _, cut in RESOLUTIONS}
+# The same cuts in SQL ({ts} is the timestamp expression), for the trigger that
+# keeps machine_log_rollups current on every machine_logs insert (db.py migration 9).
+BUCKET_SQL = (
+    ('minute', "substr({ts}, 1, 16) || ':00'"),
+    ('hour', "substr({ts}, 1, 13) || ':00:00'"),
+    ('day', "substr({ts}, 1, 10) || 'T00:00:00'"),
+)
+DEFAULT_MAX_POINTS = 500
+
+
+def parse_timestamp(value):
+    """An ISO date or timestamp as the naive local time machine_logs stores; a UTC offset is converted."""
+    ts = datetime.fromisoformat(value)
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def choose_resolution(start, end, max_points=DEFAULT_MAX_POINTS):
+    """Finest resolution whose bucket count over [start, end) fits in max_points (day if none does)."""
+    span = (parse_timestamp(end) - parse_timestamp(start)).total_seconds()
+    for resolution, seconds, _ in RESOLUTIONS:
+        if span / seconds <= max_points:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+
+def query_series(conn, machine_id_str, metric, start, end, max_points=DEFAULT_MAX_POINTS):
+    """
+    Returns (resolution, points) for one metric over [start, end) (ISO dates or
+    timestamps), each point {bucket, min, max, mean, count}.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    start, end = parse_timestamp(start).isoformat(), parse_timestamp(end).isoformat()
+    resolution = choose_resolution(start, end, max_points)
+    rows = conn.execute(f"""
+        SELECT bucket, {metric}_min, {metric}_max, {metric}_sum, reading_count
+        FROM machine_log_rollups
+        WHERE machine_id_str = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+    """, (machine_id_str, resolution, RESOLUTIONS_BY_NAME[resolution](start), end)).fetchall()
+    points = [{"bucket": b, "min": lo, "max": hi, "mean": total / count, "count": count}
+              for b, lo, hi, total, count in rows]
+    return resolution, points
+
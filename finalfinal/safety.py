@@ -0,0 +1,101 @@
+# safety.py
+import numpy as np
+
+# --- CONFIGURATION ---
+# Default alert thresholds. MODEL_THRESHOLDS overrides individual values for a
+# machine model (keyed by machines.model), e.g.
+#     'Caterpillar D6R Dozer': {'tilt_limit_deg': 20.0},
+DEFAULT_THRESHOLDS = {
+    'tilt_limit_deg': 15.0,
+    'min_visibility_percent': 50,
+    'min_hydraulic_pressure': 2900,
+    'max_engine_temp': 108,
+}
+MODEL_THRESHOLDS = {}
+
+# Rules in priority order. Each works on a single row (scalars) or on whole
+# columns (NumPy arrays) alike, so single reads and batches share one definition.
+RULES = [
+    ('Seatbelt', lambda r, t: r['seatbelt_status'] == 'Unfastened'),
+    ('Tilt', lambda r, t: r['tilt_angle'] > t['tilt_limit_deg']),
+    ('Visibility', lambda r, t: r['visibility_percent'] < t['min_visibility_percent']),
+    ('Hydraulic', lambda r, t: r['hydraulic_pressure'] < t['min_hydraulic_pressure']),
+    ('Engine', lambda r, t: r['engine_temp'] > t['max_engine_temp']),
+]
+ALERT_TYPES = [name for name, _ in RULES]
+RULE_COLUMNS = ['seatbelt_status', 'tilt_angle', 'visibility_percent', 'hydraulic_pressure', 'engine_temp']
+
+
+def thresholds_for(model):
+    return {**DEFAULT_THRESHOLDS, **MODEL_THRESHOLDS.get(model, {})}
+
+
+def active_alerts(log, model=None):
+    """Returns the alert types raised by one machine_logs row, most critical first."""
+    thresholds = thresholds_for(model)
+    return [name for name, rule in RULES if rule(log, thresholds)]
+
+
+def classify(log, model=None):
+    """Returns a copy of a row with safety_alerts and safety_alert_type added."""
+    alerts = active_alerts(log, model)
+    return dict(log, safety_alerts=alerts, safety_alert_type=alerts[0] if alerts else 'None')
+
+
+def alert_masks(columns, models=None):
+    """
+    Classifies a batch at once. `columns` maps each of RULE_COLUMNS to a sequence
+    (a DataFrame works); `models` optionally gives the machine model per row.
+    Returns a uint8 array with bit i set when RULES[i] fired for that row.
+    """
+    cols = {c: np.asarray(columns[c]) for c in RULE_COLUMNS}
+    if models is None:
+        thresholds = DEFAULT_THRESHOLDS
+    else:
+        # A dict rather than pd.factorize: the status and ingest paths shouldn't load pandas.
+        code_of = {}
+        codes = np.fromiter((code_of.setdefault(m, len(code_of)) for m in models), dtype=np.intp, count=len(models))
+        per_model = [thresholds_for(m) for m in code_of]
+        thresholds = {key: np.array([t[key] for t in per_model])[codes] for key in DEFAULT_THRESHOLDS}
+    masks = np.zeros(len(cols['tilt_angle']), dtype=np.uint8)
+    for bit, (_, rule) in enumerate(RULES):
+        masks |= np.asarray(rule(cols, thresholds), dtype=np.uint8) << bit
+    return masks
+
+
+def primary_alert_types(masks):
+    """Maps alert masks to the highest-priority alert type per row ('None' when nominal)."""
+    return np.select([(masks >> bit) & 1 == 1 for bit in range(len(RULES))], ALERT_TYPES, default='None')
+
+
+def alert_names(mask):
+    """Alert types encoded in one mask, most critical first."""
+    return [name for bit, name in enumerate(ALERT_TYPES) if int(mask) >> bit & 1]
+
+
+def alert_counts(masks):
+    """Number of rows raising each alert type."""
+    return {name: int(np.count_nonzero((masks >> bit) & 1)) for bit, name in enumerate(ALERT_TYPES)}
+
+
+def classify_frame(df, model_column='model'):
+    """Adds safety_alert_mask and safety_alert_type columns to a frame of machine_logs rows."""
+    masks = alert_masks(df, df[model_column] if model_column in df else None)
+    return df.assign(safety_alert_mask=masks, safety_alert_type=primary_alert_types(masks))
+
+
+def safety_report(conn, machine_id_str, start=None, end=None):
+    """Alert counts for one machine's readings with start <= timestamp < end, archived ones included."""
+    from archive import read_logs
+
+    df = read_logs(conn, machine_id_str, start, end)
+    model = conn.execute("SELECT model FROM machines WHERE machine_id_str = ?", (machine_id_str,)).fetchone()
+    masks = alert_masks(df, [model[0] if model else None] * len(df))
+    return {
+        "machine_id_str": machine_id_str,
+        "start": start,
+        "end": end,
+        "readings": len(df),
+        "readings_with_alerts": int(np.count_nonzero(masks)),
+        "alert_counts": alert_counts(masks),
+    }
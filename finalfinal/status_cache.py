@@ -0,0 +1,82 @@
+# status_cache.py
+import threading
+import time
+
+from db_pool import open_connection
+from safety import alert_masks, alert_names, classify
+
+# --- CONFIGURATION ---
+# How stale a read may be before the cache checks SQLite for commits from other
+# workers. Dashboards poll every few seconds, so a quarter second is invisible.
+CHECK_INTERVAL_SEC = 0.25
+
+
+class LatestStatusCache:
+    """
+    In-process copy of the latest_status table (newest machine_logs row per
+    machine), already classified by the safety rules, so /api/status reads are
+    dictionary lookups.
+
+    Writes from this worker are applied directly via apply(). Writes from other
+    workers are picked up through PRAGMA data_version, which changes whenever
+    another connection commits to the database file; when it moves, the small
+    latest_status table is reloaded.
+    """
+
+    def __init__(self, db_name, check_interval=CHECK_INTERVAL_SEC):
+        self.db_name = db_name
+        self.check_interval = check_interval
+        self._conn = None
+        self._rows = {}
+        self._models = {}
+        self._data_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, machine_id_str):
+        """Returns the latest reading for a machine as a dict, or None."""
+        self._refresh_if_changed()
+        return self._rows.get(machine_id_str)
+
+    def all(self):
+        """Returns {machine_id_str: latest reading} for every machine with readings."""
+        self._refresh_if_changed()
+        return dict(self._rows)
+
+    def apply(self, rows):
+        """Folds rows this worker just committed (machine_logs tuples) into the cache."""
+        with self._lock:
+            for row in rows:
+                current = self._rows.get(row[1])
+                if current is None or row[2] >= current['timestamp']:
+                    self._rows[row[1]] = classify({
+                        'id': row[0], 'machine_id_str': row[1], 'timestamp': row[2],
+                        'seatbelt_status': row[3], 'tilt_angle': row[4], 'visibility_percent': row[5],
+                        'hydraulic_pressure': row[6], 'engine_temp': row[7],
+                    }, self._models.get(row[1]))
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            if self._conn is None:
+                self._conn = open_connection(self.db_name)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._reload()
+                self._data_version = data_version
+            self._checked_at = time.monotonic()
+
+    def _reload(self):
+        self._models = dict(self._conn.execute("SELECT machine_id_str, model FROM machines").fetchall())
+        rows = [dict(row) for row in self._conn.execute("SELECT * FROM latest_status")]
+        if rows:
+            columns = {key: [row[key] for row in rows] for key in rows[0]}
+            masks = alert_masks(columns, [self._models.get(row['machine_id_str']) for row in rows])
+            for row, mask in zip(rows, masks):
+                row['safety_alerts'] = alert_names(mask)
+                row['safety_alert_type'] = row['safety_alerts'][0] if row['safety_alerts'] else 'None'
+        self._rows = {row['machine_id_str']: row for row in rows}
@@ -0,0 +1,130 @@
+# status_stream.py
+import json
+import queue
+import threading
+
+from safety import active_alerts
+
+# --- CONFIGURATION ---
+POLL_INTERVAL_SEC = 1.0
+HEARTBEAT_SEC = 15.0
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# A new subscriber's first state comes from latest_status, which keeps every
+# machine's newest reading even after archive.py has moved its rows out of machine_logs.
+LATEST_STATUS_QUERY = "SELECT * FROM latest_status WHERE machine_id_str = ?"
+LOGS_SINCE_QUERY = "SELECT * FROM machine_logs WHERE machine_id_str = ? AND timestamp > ? ORDER BY timestamp"
+
+
+def format_sse(event, data):
+    """Encodes one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StatusWatcher:
+    """
+    One background thread per worker that polls machine_logs for the machines
+    somebody is watching and fans new rows out to every subscriber, so N
+    dashboards on one machine cost one query per poll instead of N.
+    """
+
+    def __init__(self, pool, poll_interval=POLL_INTERVAL_SEC):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self._subscribers = {}   # machine_id_str -> set of queues
+        self._latest = {}        # machine_id_str -> last row pushed
+        self._alerts = {}        # machine_id_str -> alert list of that row
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, machine_id_str, q=None):
+        """
+        Registers a subscriber queue, primed with the machine's current status if
+        known. Any object with queue.Queue's full/get_nowait/put_nowait will do
+        (asgi.py passes one an event loop can await).
+        """
+        if q is None:
+            q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(machine_id_str, set()).add(q)
+            if machine_id_str in self._latest:
+                q.put_nowait(format_sse('status', self._status_payload(machine_id_str)))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='status-watcher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return q
+
+    def unsubscribe(self, machine_id_str, q):
+        with self._lock:
+            subscribers = self._subscribers.get(machine_id_str)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[machine_id_str]
+                    self._latest.pop(machine_id_str, None)
+                    self._alerts.pop(machine_id_str, None)
+
+    def stream(self, machine_id_str):
+        """Generator of SSE messages for one client; unsubscribes when the client goes away."""
+        q = self.subscribe(machine_id_str)
+        try:
+            while True:
+                try:
+                    yield q.get(timeout=HEARTBEAT_SEC)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(machine_id_str, q)
+
+    def _status_payload(self, machine_id_str):
+        alerts = self._alerts[machine_id_str]
+        return dict(self._latest[machine_id_str], safety_alerts=alerts, safety_alert_type=alerts[0] if alerts else 'None')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                watched = {m: self._latest.get(m, {}).get('timestamp') for m in self._subscribers}
+            if watched:
+                try:
+                    self.poll(watched)
+                except Exception as e:
+                    print(f"Status watcher error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def poll(self, watched):
+        """Fetches rows newer than the last one pushed for each watched machine and publishes them."""
+        with self.pool.connection() as conn:
+            models = dict(conn.execute("SELECT machine_id_str, model FROM machines").fetchall())
+            for machine_id_str, since in watched.items():
+                if since is None:
+                    rows = conn.execute(LATEST_STATUS_QUERY, (machine_id_str,)).fetchall()
+                else:
+                    rows = conn.execute(LOGS_SINCE_QUERY, (machine_id_str, since)).fetchall()
+                for row in rows:
+                    self.publish(machine_id_str, dict(row), models.get(machine_id_str))
+
+    def publish(self, machine_id_str, log, model=None):
+        """Pushes a new row, plus an 'alert' event when the set of active alerts changes."""
+        alerts = active_alerts(log, model)
+        with self._lock:
+            subscribers = self._subscribers.get(machine_id_str)
+            if not subscribers:
+                return
+            previous = self._alerts.get(machine_id_str)
+            self._latest[machine_id_str] = log
+            self._alerts[machine_id_str] = alerts
+            messages = [format_sse('status', self._status_payload(machine_id_str))]
+            if previous is not None and previous != alerts:
+                messages.append(format_sse('alert', {'machine_id_str': machine_id_str, 'previous': previous, 'current': alerts}))
+            for q in subscribers:
+                for message in messages:
+                    if q.full():
+                        # A stalled client only needs the newest state; drop its oldest message.
+                        try:
+                            q.get_nowait()
+                        except queue.Empty:
+                            pass
+                    q.put_nowait(message)
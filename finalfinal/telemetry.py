@@ -0,0 +1,153 @@
+# telemetry.py
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+# --- CONFIGURATION ---
+MAX_BATCH_ROWS = 10000        # per HTTP request
+BUFFER_MAX_ROWS = 100000      # rows waiting to be written before ingestion pushes back
+FLUSH_MAX_ROWS = 20000        # rows per group commit
+FLUSH_INTERVAL_SEC = 0.02     # how long the writer waits to gather a fuller batch
+MAX_CLOCK_SKEW_SEC = 300      # how far ahead of the server's clock a reading may be dated
+
+SEATBELT_STATES = {'Fastened', 'Unfastened'}
+NUMERIC_FIELDS = ('tilt_angle', 'visibility_percent', 'hydraulic_pressure', 'engine_temp')
+
+LOG_COLUMNS = ['id', 'machine_id_str', 'timestamp', 'seatbelt_status', 'tilt_angle', 'visibility_percent', 'hydraulic_pressure', 'engine_temp']
+INSERT_LOG_SQL = """
+    INSERT INTO machine_logs (id, machine_id_str, timestamp, seatbelt_status, tilt_angle, visibility_percent, hydraulic_pressure, engine_temp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class BufferFull(Exception):
+    """Raised when the write buffer cannot take a batch; callers should retry later."""
+
+
+def validate_readings(readings, known_machines):
+    """
+    Validates a batch of readings. Returns (rows, errors): rows are tuples ready
+    for INSERT_LOG_SQL, errors is a list of {"index", "error"} dicts. A batch with
+    any error should be rejected as a whole.
+
+    Timestamps are stored as naive local ISO strings, which the latest_status
+    trigger and the status stream compare as text, so a reading with a UTC
+    offset or dated more than MAX_CLOCK_SKEW_SEC ahead is rejected.
+    """
+    if not isinstance(readings, list):
+        return [], [{"index": None, "error": "readings must be a list"}]
+    if len(readings) > MAX_BATCH_ROWS:
+        return [], [{"index": None, "error": f"at most {MAX_BATCH_ROWS} readings per request"}]
+
+    now = datetime.now()
+    latest_allowed = now + timedelta(seconds=MAX_CLOCK_SKEW_SEC)
+    rows, errors = [], []
+    for i, r in enumerate(readings):
+        try:
+            machine_id_str = r['machine_id_str']
+            if machine_id_str not in known_machines:
+                raise ValueError(f"unknown machine '{machine_id_str}'")
+            if r['seatbelt_status'] not in SEATBELT_STATES:
+                raise ValueError("seatbelt_status must be 'Fastened' or 'Unfastened'")
+            tilt, visibility, pressure, temp = (float(r[f]) for f in NUMERIC_FIELDS)
+            if not 0 <= visibility <= 100:
+                raise ValueError("visibility_percent must be between 0 and 100")
+            timestamp = datetime.fromisoformat(r['timestamp']) if r.get('timestamp') else now
+            if timestamp.tzinfo is not None:
+                raise ValueError("timestamp must be local time without a UTC offset")
+            if timestamp > latest_allowed:
+                raise ValueError("timestamp is in the future")
+            timestamp = timestamp.isoformat()
+            rows.append((str(uuid.uuid4()), machine_id_str, timestamp, r['seatbelt_status'],
+                         tilt, int(visibility), pressure, temp))
+        except KeyError as e:
+            errors.append({"index": i, "error": f"missing field {e}"})
+        except (TypeError, ValueError) as e:
+            errors.append({"index": i, "error": str(e)})
+    return rows, errors
+
+
+class _Ticket:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class TelemetryWriter:
+    """
+    Bounded in-memory write buffer with group commit: batches from many
+    requests are written by one background thread with executemany in a single
+    transaction, so concurrent ingest calls share one commit.
+    """
+
+    def __init__(self, pool, max_rows=BUFFER_MAX_ROWS):
+        self.pool = pool
+        self.max_rows = max_rows
+        self._pending = deque()   # (rows, ticket)
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.on_commit = []       # callbacks receiving each committed list of rows
+
+    def submit(self, rows):
+        """Queues rows for the next group commit and returns a ticket; raises BufferFull when over capacity."""
+        ticket = _Ticket()
+        with self._cond:
+            if self._pending_rows + len(rows) > self.max_rows:
+                raise BufferFull(f"telemetry buffer holds {self._pending_rows} rows; retry shortly")
+            self._pending.append((rows, ticket))
+            self._pending_rows += len(rows)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ticket
+
+    def write(self, rows, timeout=30):
+        """Queues rows and blocks until they are committed."""
+        ticket = self.submit(rows)
+        if not ticket.done.wait(timeout):
+            raise TimeoutError("telemetry write was not committed in time")
+        if ticket.error:
+            raise ticket.error
+        return len(rows)
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give concurrent requests a moment to join this commit.
+            deadline = time.monotonic() + FLUSH_INTERVAL_SEC
+            while self._pending_rows < FLUSH_MAX_ROWS and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch, count = [], 0
+            while self._pending and (not batch or count + len(self._pending[0][0]) <= FLUSH_MAX_ROWS):
+                rows, ticket = self._pending.popleft()
+                batch.append((rows, ticket))
+                count += len(rows)
+            self._pending_rows -= count
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            rows = [row for chunk, _ in batch for row in chunk]
+            error = None
+            try:
+                with self.pool.connection() as conn:
+                    conn.executemany(INSERT_LOG_SQL, rows)
+                    conn.commit()
+            except Exception as e:
+                print(f"Telemetry write error: {e}")
+                error = e
+            for _, ticket in batch:
+                ticket.error = error
+                ticket.done.set()
+            if error is None:
+                for callback in self.on_commit:
+                    try:
+                        callback(rows)
+                    except Exception as e:
+                        print(f"Telemetry commit hook error: {e}")
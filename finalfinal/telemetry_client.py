@@ -0,0 +1,73 @@
+# telemetry_client.py
+"""
+Client helper for machines pushing readings to /api/telemetry.
+
+    client = TelemetryClient("http://localhost:5000", api_key=os.environ["INGEST_API_KEY"])
+    client.add("EXC001", "Fastened", tilt_angle=3.2, visibility_percent=95,
+               hydraulic_pressure=3050, engine_temp=92)
+    client.flush()
+
+Readings are buffered locally and sent in batches; a batch the server cannot
+take yet (HTTP 503) is retried after the Retry-After delay.
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_RETRIES = 5
+
+
+class TelemetryClient:
+    def __init__(self, base_url, api_key, batch_size=DEFAULT_BATCH_SIZE, timeout=30):
+        self.url = base_url.rstrip('/') + '/api/telemetry'
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._buffer = []
+
+    def add(self, machine_id_str, seatbelt_status, tilt_angle, visibility_percent,
+            hydraulic_pressure, engine_temp, timestamp=None):
+        """Buffers one reading, sending a batch once batch_size readings are waiting."""
+        self._buffer.append({
+            "machine_id_str": machine_id_str,
+            "seatbelt_status": seatbelt_status,
+            "tilt_angle": tilt_angle,
+            "visibility_percent": visibility_percent,
+            "hydraulic_pressure": hydraulic_pressure,
+            "engine_temp": engine_temp,
+            "timestamp": (timestamp or datetime.now()).isoformat(),
+        })
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Sends every buffered reading; returns the number the server accepted."""
+        accepted = 0
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                accepted += self.send(batch)
+            except Exception:
+                self._buffer = batch + self._buffer
+                raise
+        return accepted
+
+    def send(self, readings):
+        """Posts one batch of reading dicts, retrying while the server's write buffer is full."""
+        body = json.dumps({"readings": readings}).encode()
+        for attempt in range(MAX_RETRIES):
+            req = urllib.request.Request(self.url, data=body, method='POST', headers={
+                'Content-Type': 'application/json',
+                'X-API-Key': self.api_key,
+            })
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    return json.load(resp)['accepted']
+            except urllib.error.HTTPError as e:
+                if e.code != 503 or attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(float(e.headers.get('Retry-After', 1)))
+        return 0